@@ -1,8 +1,9 @@
+import os
 import logging
 import asyncio
 import json
-import time
-from livekit import rtc, api
+from contextlib import asynccontextmanager
+from livekit import rtc
 from livekit.agents import (
     Agent,
     AgentSession,
@@ -10,14 +11,16 @@ from livekit.agents import (
     RoomOutputOptions,
     get_job_context,
     JobContext,
+    JobProcess,
     WorkerOptions,
+    utils,
     cli,
     function_tool,
     ToolError,
-    RunContext
+    RunContext,
+    UserInputTranscribedEvent,
 )
 from livekit.agents.llm import ImageContent, ChatContext, ChatMessage
-from livekit.api import RoomParticipantIdentity
 
 from dotenv import load_dotenv
 from livekit.plugins import (
@@ -27,58 +30,156 @@ from livekit.plugins import (
 )
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 from openai.types.beta.realtime.session import TurnDetection
-from prompt import getAgentDetails, queryQdrant, getCollectionName
+from prompt import AgentConfig, getAgentConfig, preloadAgentConfigs, queryQdrant, warmConnections, warmKnowledgebase
+from participants import getParticipant
+from clients import registry
+from prefetch import SpeculativePrefetcher
+from video import VideoFramePipeline
+from metrics import PROMETHEUS_MULTIPROC_DIR, PROMETHEUS_PORT, SessionTracer, pending_tool_calls, span
+from loopwatchdog import LOOP_WATCHDOG, watchdog
+from workerload import LOAD_THRESHOLD, worker_load
+from resilience import CircuitOpenError
+from audiocache import audio_cache
 
 load_dotenv()
 logger = logging.getLogger("voice-agent")
 
+# Comma separated agent ids whose configs are fetched when a worker process starts
+HOT_AGENT_IDS = [agent_id.strip() for agent_id in os.getenv("HOT_AGENT_IDS", "").split(",") if agent_id.strip()]
+# Start knowledge-base retrieval from user transcripts before the model calls the tool
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "false").lower() == "true"
+# The realtime model's voice. The cached greeting and filler clips are synthesized with the same
+# voice by audiocache.TTS_MODEL, which renders it slightly differently from the realtime model
+AGENT_VOICE = os.getenv("AGENT_VOICE", "alloy")
+# Play a short pre-synthesized acknowledgement when a knowledge-base lookup runs long
+TOOL_FILLER = os.getenv("TOOL_FILLER", "false").lower() == "true"
+TOOL_FILLER_TEXT = os.getenv("TOOL_FILLER_TEXT", "Let me check that for you.")
+TOOL_FILLER_DELAY_MS = float(os.getenv("TOOL_FILLER_DELAY_MS", "400"))
+GREETING_TEXT = os.getenv(
+    "GREETING_TEXT",
+    "Hey, I’m your AI guide—here to help you get answers fast, even the ones you might not find on the website. Ask me anything—I’d love to help you.",
+)
+# Play the greeting from a cached TTS clip; turn off if its voice should match the rest of the call exactly
+GREETING_CLIP = os.getenv("GREETING_CLIP", "true").lower() == "true"
+# How long the greeting waits for its cached clip to load before the model speaks it instead
+GREETING_WAIT_MS = float(os.getenv("GREETING_WAIT_MS", "500"))
+
 
 class Assistant(Agent):
-    def __init__(self, instructions=str) -> None:
-        self._latest_frame = None
-        self._video_stream = None
-        self._tasks = []
+    def __init__(
+        self,
+        instructions=str,
+        agent_config: AgentConfig | None = None,
+        prefetcher: SpeculativePrefetcher | None = None,
+        filler: str | None = None,
+        filler_delay: float = TOOL_FILLER_DELAY_MS / 1000,
+        voice: str = AGENT_VOICE,
+    ) -> None:
+        # Resolved once per session in the entrypoint; the participant and agent never change
+        self._agent_config = agent_config
+        self._prefetcher = prefetcher
+        # Spoken from the audio cache when a tool call outlasts filler_delay seconds
+        self._filler_text = filler
+        self._filler_delay = filler_delay
+        self._voice = voice
+        # Samples the user's video track and keeps the latest frame encoded off the event loop
+        self._video = VideoFramePipeline()
         super().__init__(instructions=instructions)
 
 
     
     @function_tool()
     async def lookup_knowledgebase(
+        self,
         context: RunContext,
         query: str,
     ) -> dict:
         """Look information in the knowledge base of the company you're representing. Use this to answer users questions you're not sure about."""
 
-        room = get_job_context().room
-        participant_identity = next(iter(room.remote_participants))
-        async with api.LiveKitAPI() as lkapi:
-            res = await lkapi.room.get_participant(RoomParticipantIdentity(
-                room=room.name,
-                identity=participant_identity,
-            ))
-
-            collection_name, companyId = getCollectionName(res.name)
-
-            if not collection_name:
-                raise ToolError("Knowledge base not found. Please try again later.")
-            response = queryQdrant(query, collection_name, companyId)
-            logger.info(f"Response from Qdrant: {response}")
-            if not response or not response.points:
-                raise ToolError("No results found in the knowledge base.")
-
-            # Process and format the response
-            results = []
-            for point in response.points:
-                if hasattr(point, 'payload') and point.payload and 'content' in point.payload:
-                    results.append({
-                        'content': point.payload['content'],
-                        'score': point.score
-                    })
-            
-            if not results:
-                raise ToolError("No content found in the knowledge base.")
-
-            return {'results': results}
+        with span("tool_total"), pending_tool_calls.track_inprogress():
+            async with self._filler(context):
+                return await self._lookup_knowledgebase(query, last_turn=self._last_user_turn(context))
+
+    @asynccontextmanager
+    async def _filler(self, context: RunContext | None):
+        # plays the cached filler clip once the tool has run for filler_delay, and stops it
+        # as soon as the result arrives so the reply is not queued behind it
+        if self._filler_text is None or context is None:
+            yield
+            return
+
+        handles = []
+
+        def _say(step: int):
+            clip = audio_cache.get(self._filler_text, voice=self._voice)
+            if clip is None:
+                # not synthesized yet, and synthesizing now would take longer than the lookup
+                return None
+            handle = context.session.say(self._filler_text, audio=clip.frames(), add_to_chat_ctx=False)
+            handles.append(handle)
+            return handle
+
+        try:
+            async with context.with_filler(_say, delay=self._filler_delay):
+                yield
+        finally:
+            for handle in handles:
+                handle.interrupt(force=True)
+
+    def _last_user_turn(self, context: RunContext | None) -> str | None:
+        # the user turn the agent's previous reply answered, used to contextualize follow-up
+        # questions. The current turn is never used: a realtime model's transcript lands in
+        # history asynchronously, so whether it is there when the tool runs is a race. History
+        # is ordered by creation time, so the current turn always sorts after that reply.
+        if context is None:
+            return None
+        replied = False
+        for item in reversed(context.session.history.items):
+            if item.type != "message":
+                continue
+            if item.role == "assistant":
+                replied = True
+            elif replied and item.role == "user" and item.text_content:
+                return item.text_content
+        return None
+
+    async def _lookup_knowledgebase(self, query: str, last_turn: str | None = None) -> dict:
+        agent_config = self._agent_config
+        if not agent_config or not agent_config.collection_name:
+            raise ToolError("Knowledge base not found. Please try again later.")
+        response = None
+        if self._prefetcher is not None:
+            response = await self._prefetcher.lookup(query)
+        if response is None:
+            try:
+                response = await queryQdrant(
+                    query,
+                    agent_config.collection_name,
+                    agent_config.company_id,
+                    kb_version=agent_config.kb_version,
+                    last_turn=last_turn,
+                )
+            except asyncio.TimeoutError:
+                raise ToolError("The knowledge base took too long to respond. Please try again.")
+            except CircuitOpenError:
+                raise ToolError("The knowledge base is temporarily unavailable. Please try again later.")
+        logger.info(f"Response from Qdrant: {response}")
+        if not response or not response.points:
+            raise ToolError("No results found in the knowledge base.")
+
+        # Process and format the response
+        results = []
+        for point in response.points:
+            if hasattr(point, 'payload') and point.payload and 'content' in point.payload:
+                results.append({
+                    'content': point.payload['content'],
+                    'score': point.score
+                })
+
+        if not results:
+            raise ToolError("No content found in the knowledge base.")
+
+        return {'results': results}
 
     # @function_tool()
     # async def label_page_elements(
@@ -120,61 +221,103 @@ class Assistant(Agent):
         remote_participant = list(room.remote_participants.values())[0]
         video_tracks = [publication.track for publication in list(remote_participant.track_publications.values()) if publication.track.kind == rtc.TrackKind.KIND_VIDEO]
         if video_tracks:
-            self._create_video_stream(video_tracks[0])
+            self._video.start(video_tracks[0])
         
         # Watch for new video tracks not yet published
         @room.on("track_subscribed")
         def on_track_subscribed(track: rtc.Track, publication: rtc.RemoteTrackPublication, participant: rtc.RemoteParticipant):
             if track.kind == rtc.TrackKind.KIND_VIDEO:
-                self._create_video_stream(track)
+                self._video.start(track)
+
+    async def on_exit(self):
+        await self._video.aclose()
                         
     async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage) -> None:
         # Add the latest video frame, if any, to the new message
-        if self._latest_frame:
-            new_message.content.append(ImageContent(image=self._latest_frame))
-            self._latest_frame = None
-    
-    # Helper method to buffer the latest video frame from the user's track
-    def _create_video_stream(self, track: rtc.Track):
-        # Close any existing stream (we only want one at a time)
-        if self._video_stream is not None:
-            self._video_stream.close()
-
-        # Create a new stream to receive frames    
-        self._video_stream = rtc.VideoStream(track)
-        async def read_stream():
-            async for event in self._video_stream:
-                # Store the latest frame for use later
-                self._latest_frame = event.frame
-        
-        # Store the async task
-        task = asyncio.create_task(read_stream())
-        task.add_done_callback(lambda t: self._tasks.remove(t))
-        self._tasks.append(task)
+        image = self._video.take_latest()
+        if image:
+            new_message.content.append(ImageContent(image=image))
+
+
+def prewarm(proc: JobProcess):
+    # Runs once per job process before a job is assigned to it. The realtime model does its
+    # own turn detection, so there is no VAD to load; hot agents' configs are fetched here so
+    # their rooms skip the agent API.
+    proc.userdata["agent_configs"] = preloadAgentConfigs(HOT_AGENT_IDS)
 
 
 async def entrypoint(ctx: JobContext):
     await ctx.connect()
 
+    # report event-loop lag and the stack of anything that blocks this process's loop
+    if LOOP_WATCHDOG:
+        watchdog.start()
+
+    # per-turn stage timings for this session; tasks spawned from here on inherit it
+    tracer = SessionTracer(ctx.room.name)
+    tracer.activate()
+
+    # share pooled upstream clients with other sessions in this process. Shutdown callbacks
+    # run concurrently, so this session's teardown runs in order in one of them and the
+    # clients are released last, once nothing of the session can use them anymore
+    registry.acquire()
+    teardown = []
+
+    async def _shutdown():
+        for cleanup in reversed(teardown):
+            try:
+                await cleanup()
+            except Exception as e:
+                logger.warning(f"Failed to tear down session: {str(e)}")
+        await registry.release()
+
+    ctx.add_shutdown_callback(_shutdown)
+    # open upstream connections while we wait for the participant to join
+    warm_task = asyncio.create_task(warmConnections())
+    teardown.append(lambda: utils.aio.cancel_and_wait(warm_task))
+    if TOOL_FILLER:
+        # loaded from disk after the first synthesis on this host
+        audio_cache.warm(TOOL_FILLER_TEXT, voice=AGENT_VOICE)
+    # the greeting is the same for every room: load its audio while the participant joins
+    greeting_clip = audio_cache.warm(GREETING_TEXT, voice=AGENT_VOICE) if GREETING_CLIP else None
+
     participant = await ctx.wait_for_participant()
     logger.info(f"starting voice assistant for participant {participant.identity}")
 
-    async with api.LiveKitAPI() as lkapi:
-        res = await lkapi.room.get_participant(RoomParticipantIdentity(
-        room=ctx.job.room.name,
-        identity=participant.identity,
-        ))
+    try:
+        with span("participant_lookup"):
+            res = await getParticipant(ctx.job.room.name, participant.identity)
         logger.info(f"Participant info: {res.identity}, {res.name}, {res.metadata}")
+    except Exception as e:
+        logger.warning(f"Failed to look up participant {participant.identity}: {str(e)}")
 
-    start_time = time.time()
-    systemPrompt = getAgentDetails(participant.name)
+    agent_config = ctx.proc.userdata.get("agent_configs", {}).get(participant.name)
+    if agent_config is None:
+        try:
+            with span("agent_config_fetch"):
+                agent_config = await getAgentConfig(participant.name)
+        except Exception as e:
+            logger.error(f"Failed to retrieve agent details: {str(e)}")
+            agent_config = AgentConfig(
+                agent_id=participant.name,
+                system_prompt=f"Failed to retrieve agent details: {str(e)}",
+                collection_name=None,
+                company_id=None,
+            )
+    systemPrompt = agent_config.system_prompt
     logger.info(f"System prompt: {systemPrompt}")
-    elapsed_time = time.time() - start_time
-    logger.info(f"getAgentDetails took {elapsed_time:.2f} seconds")
+
+    # sync the company's local knowledge-base index in the background, if enabled
+    warmKnowledgebase(agent_config.collection_name, agent_config.company_id, agent_config.kb_version)
+
+    prefetcher = None
+    if SPECULATIVE_PREFETCH and agent_config.collection_name:
+        prefetcher = SpeculativePrefetcher(agent_config)
+        teardown.append(prefetcher.aclose)
 
     session = AgentSession(
         llm=openai.realtime.RealtimeModel(
-            voice="alloy",
+            voice=AGENT_VOICE,
             model="gpt-4o-realtime-preview-2025-06-03",
             turn_detection=TurnDetection(
                 type="semantic_vad",
@@ -184,9 +327,21 @@ async def entrypoint(ctx: JobContext):
             ),
         )
     ) 
+    tracer.attach(session)
+
+    if prefetcher is not None:
+        @session.on("user_input_transcribed")
+        def on_user_input_transcribed(ev: UserInputTranscribedEvent):
+            prefetcher.on_transcript(ev.transcript, is_final=ev.is_final)
+
     await session.start(
         room=ctx.room,
-        agent=Assistant(instructions=systemPrompt),
+        agent=Assistant(
+            instructions=systemPrompt,
+            agent_config=agent_config,
+            prefetcher=prefetcher,
+            filler=TOOL_FILLER_TEXT if TOOL_FILLER else None,
+        ),
         room_input_options=RoomInputOptions(
             noise_cancellation=noise_cancellation.BVC(),
             video_enabled=True,
@@ -196,10 +351,23 @@ async def entrypoint(ctx: JobContext):
         room_output_options=RoomOutputOptions(transcription_enabled=True),
     )
 
-    await session.generate_reply(
-        instructions="say: Hey, I’m your AI guide—here to help you get answers fast, even the ones you might not find on the website. Ask me anything—I’d love to help you."
-    )
+    # usually loaded from disk by now; a clip still being synthesized is left for the next room
+    if greeting_clip is not None:
+        await asyncio.wait([greeting_clip], timeout=GREETING_WAIT_MS / 1000)
+    if greeting_clip is not None and greeting_clip.done() and not greeting_clip.cancelled() and greeting_clip.exception() is None:
+        await session.say(GREETING_TEXT, audio=greeting_clip.result().frames())
+    else:
+        await session.generate_reply(instructions=f"say: {GREETING_TEXT}")
 
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    cli.run_app(WorkerOptions(
+        entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
+        # stop taking rooms once CPU, event-loop lag, sessions or tool calls near capacity
+        load_fnc=worker_load,
+        load_threshold=LOAD_THRESHOLD,
+        # stage latency histograms of every job process, served at :PROMETHEUS_PORT/metrics
+        prometheus_port=PROMETHEUS_PORT,
+        prometheus_multiproc_dir=PROMETHEUS_MULTIPROC_DIR,
+    ))
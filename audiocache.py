@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import os
+import wave
+import asyncio
+import hashlib
+import logging
+from typing import AsyncIterator, Awaitable, Callable
+
+from livekit import rtc
+from livekit.plugins import openai
+
+from cache import SingleFlight, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Default values for environment variables
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.expanduser("~/.cache/breezeflow/audio"))
+AUDIO_CACHE_SIZE = int(os.getenv("AUDIO_CACHE_SIZE", "64"))
+# Shares voice names with the realtime models, but its rendering of a voice is not identical
+TTS_MODEL = os.getenv("TTS_MODEL", "gpt-4o-mini-tts")
+
+_FRAME_MS = 20
+
+
+class AudioClip:
+    """A synthesized utterance held as 16-bit PCM, played back as 20ms frames."""
+
+    def __init__(self, *, pcm: bytes, sample_rate: int, num_channels: int) -> None:
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+
+    @classmethod
+    def from_frame(cls, frame: rtc.AudioFrame) -> AudioClip:
+        return cls(pcm=bytes(frame.data), sample_rate=frame.sample_rate, num_channels=frame.num_channels)
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / (2 * self.num_channels * self.sample_rate)
+
+    async def frames(self) -> AsyncIterator[rtc.AudioFrame]:
+        """Yield the clip as frames for ``AgentSession.say(audio=...)``."""
+        frame_size = self.sample_rate * _FRAME_MS // 1000 * self.num_channels * 2
+        for start in range(0, len(self.pcm), frame_size):
+            chunk = self.pcm[start:start + frame_size]
+            yield rtc.AudioFrame(chunk, self.sample_rate, self.num_channels, len(chunk) // (2 * self.num_channels))
+
+
+class AudioClipCache:
+    """Fixed phrases synthesized once and replayed without a TTS round trip.
+
+    Clips are keyed by TTS model, voice, text and an optional scope (e.g. an
+    agent id) and kept in a bounded in-memory LRU. Each clip is also written
+    to ``path`` as a WAV file, so it survives restarts and is shared by every
+    job process on the host. Concurrent requests for the same clip share one
+    synthesis.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        model: str = TTS_MODEL,
+        maxsize: int = AUDIO_CACHE_SIZE,
+        synthesize: Callable[[str, str], Awaitable[rtc.AudioFrame]] | None = None,
+    ) -> None:
+        self._path = path
+        self._model = model
+        self._clips = TTLCache(maxsize=maxsize, ttl=float("inf"))
+        self._flight = SingleFlight()
+        self._synthesize = synthesize or self._synthesizeOpenAI
+
+    def key(self, text: str, *, voice: str, scope: str = "") -> str:
+        return hashlib.sha1("\0".join((self._model, voice, scope, text)).encode("utf-8")).hexdigest()
+
+    def get(self, text: str, *, voice: str, scope: str = "") -> AudioClip | None:
+        """Return the clip if it is already in memory, without blocking."""
+        return self._clips.get(self.key(text, voice=voice, scope=scope))
+
+    async def load(self, text: str, *, voice: str, scope: str = "") -> AudioClip:
+        """Return the clip from memory or disk, synthesizing and storing it on a miss."""
+        key = self.key(text, voice=voice, scope=scope)
+        clip = self._clips.get(key)
+        if clip is not None:
+            return clip
+
+        async def _load():
+            clip = await asyncio.to_thread(self._read, key)
+            if clip is None:
+                clip = AudioClip.from_frame(await self._synthesize(text, voice))
+                await asyncio.to_thread(self._write, key, clip)
+                logger.info(f"Synthesized {clip.duration:.1f}s clip for voice {voice}: {text[:40]!r}")
+            self._clips.set(key, clip)
+            return clip
+
+        return await self._flight.do(key, _load)
+
+    def warm(self, text: str, *, voice: str, scope: str = "") -> asyncio.Future:
+        """Load the clip in the background."""
+        fut = asyncio.ensure_future(self.load(text, voice=voice, scope=scope))
+        fut.add_done_callback(self._on_loaded)
+        return fut
+
+    def _on_loaded(self, fut: asyncio.Future) -> None:
+        if not fut.cancelled() and fut.exception() is not None:
+            logger.warning(f"Failed to load audio clip: {fut.exception()}")
+
+    async def _synthesizeOpenAI(self, text: str, voice: str) -> rtc.AudioFrame:
+        # raw 24kHz PCM needs no decoding and is stored as is
+        tts = openai.TTS(model=self._model, voice=voice, response_format="pcm")
+        try:
+            return await tts.synthesize(text).collect()
+        finally:
+            await tts.aclose()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self._path, f"{key}.wav")
+
+    def _read(self, key: str) -> AudioClip | None:
+        try:
+            with wave.open(self._file(key), "rb") as f:
+                return AudioClip(pcm=f.readframes(f.getnframes()), sample_rate=f.getframerate(), num_channels=f.getnchannels())
+        except (OSError, EOFError, wave.Error):
+            return None
+
+    def _write(self, key: str, clip: AudioClip) -> None:
+        os.makedirs(self._path, exist_ok=True)
+        # written under a temporary name, so other processes never read a partial clip
+        tmp = f"{self._file(key)}.{os.getpid()}"
+        with wave.open(tmp, "wb") as f:
+            f.setnchannels(clip.num_channels)
+            f.setsampwidth(2)
+            f.setframerate(clip.sample_rate)
+            f.writeframes(clip.pcm)
+        os.replace(tmp, self._file(key))
+
+
+audio_cache = AudioClipCache(AUDIO_CACHE_DIR)
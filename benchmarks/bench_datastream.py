@@ -0,0 +1,99 @@
+"""Microbenchmark for the Breezeflow data stream parser.
+
+Replays a large recorded (or synthetic) data stream through ``DataStreamParser``
+at several network chunk sizes and reports parts/second, alongside the previous
+line-by-line decode loop for comparison. Results are printed as JSON.
+
+    python benchmarks/bench_datastream.py --parts 200000
+    python benchmarks/bench_datastream.py --file recorded_stream.txt
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from datastream import DataStreamParser  # noqa: E402
+
+WORDS = ["Breezeflow", "helps", "your", "visitors", "find", "answers", "café", "—", "pricing", "\"demo\"", "\n"]
+
+
+def synthetic_stream(parts: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    lines = ['f:{"messageId":"msg-bench"}']
+    for i in range(parts):
+        if i and i % 5000 == 0:
+            args = {"query": " ".join(rng.choices(WORDS, k=6))}
+            lines.append("9:" + json.dumps({"toolCallId": f"call-{i}", "toolName": "lookup", "args": args}))
+        lines.append("0:" + json.dumps(" " + rng.choice(WORDS)))
+    lines.append('d:{"finishReason":"stop","usage":{"promptTokens":1200,"completionTokens":%d}}' % parts)
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def chunked(data: bytes, chunk_size: int) -> list[bytes]:
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def bench_parser(chunks: list[bytes]) -> int:
+    parser = DataStreamParser()
+    count = 0
+    for chunk in chunks:
+        count += len(parser.feed(chunk))
+    return count + len(parser.flush())
+
+
+def bench_legacy(data: bytes) -> int:
+    # the previous implementation: iterate complete lines, decode each, only keep text parts
+    count = 0
+    for line in data.splitlines(keepends=True):
+        line = line.decode().strip()
+        if line and line.startswith("0:"):
+            try:
+                json.loads(line[2:])
+                count += 1
+            except json.JSONDecodeError:
+                continue
+    return count
+
+
+def measure(fnc, *args, repeat: int) -> dict:
+    timings = []
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fnc(*args)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {"parts": count, "seconds": round(best, 6), "parts_per_second": round(count / best)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="recorded data stream to replay")
+    parser.add_argument("--parts", type=int, default=100000, help="text parts in the synthetic stream")
+    parser.add_argument("--chunk-sizes", default="64,1024,16384", help="comma separated network chunk sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            data = f.read()
+    else:
+        data = synthetic_stream(args.parts)
+
+    results = {
+        "stream_bytes": len(data),
+        "legacy_lines": measure(bench_legacy, data, repeat=args.repeat),
+        "parser": {},
+    }
+    for chunk_size in (int(size) for size in args.chunk_sizes.split(",")):
+        results["parser"][str(chunk_size)] = measure(bench_parser, chunked(data, chunk_size), repeat=args.repeat)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Offline latency and throughput benchmark of the agent's upstream calls.
+
+Starts the local stand-ins from ``fakes.py`` (agent API, embeddings, streaming
+chat, local-mode Qdrant) and measures ``getAgentConfig``, the legacy
+``getAgentDetails``, the ``lookup_knowledgebase`` tool and
+``breezeflowLLm.LLM.chat`` at each concurrency level. ``cold`` runs use unique
+agent ids and queries so that every request misses the caches; ``warm`` runs
+repeat one key. Results are printed as JSON to diff between releases.
+
+    python benchmarks/bench_services.py --concurrency 1,8,32 --latency-ms 50
+    python benchmarks/bench_services.py --scenarios chat --token-delay-ms 20 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# must be set before the agent modules read them at import time
+os.environ["QDRANT_URL"] = ":memory:"
+os.environ.setdefault("EMBEDDING_CACHE_DIR", tempfile.mkdtemp(prefix="bench-embeddings-"))
+os.environ.setdefault("AGENT_CONFIG_CACHE_DIR", tempfile.mkdtemp(prefix="bench-agents-"))
+
+from fakes import FakeServices, seed_qdrant  # noqa: E402
+
+SCENARIOS = ("agent_config", "agent_details", "lookup_knowledgebase", "chat")
+
+
+def summarize(latencies: list[float], errors: int, wall: float) -> dict:
+    if not latencies:
+        return {"requests": errors, "errors": errors}
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+async def run_load(fnc, *, requests: int, concurrency: int) -> dict:
+    """Call ``fnc(i)`` ``requests`` times with at most ``concurrency`` calls in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def _one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await fnc(i)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(requests)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def bench(args: argparse.Namespace) -> dict:
+    services = FakeServices(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        token_delay=args.token_delay_ms / 1000,
+        tokens=args.tokens,
+    )
+    await services.start()
+    os.environ.update(services.env())
+
+    import prompt
+    import breezeflowLLm
+    from agent import Assistant
+    from clients import registry
+    from livekit.agents import llm
+
+    await seed_qdrant(registry.qdrant, args.documents)
+    config = await prompt.getAgentConfig("bench-agent")
+    assistant = Assistant(instructions=config.system_prompt, agent_config=config)
+    chat_llm = breezeflowLLm.LLM(chatbot_id="bench", api_url=f"{services.url}/api/agent/chat")
+    run_id = time.monotonic_ns()
+
+    def reset_caches() -> None:
+        prompt._agent_configs.clear()
+        prompt.semantic_cache.invalidate()
+
+    async def agent_config(i: int, cold: bool) -> None:
+        await prompt.getAgentConfig(f"bench-agent-{run_id}-{i}" if cold else "bench-agent")
+
+    async def agent_details(i: int, cold: bool) -> None:
+        # the legacy helper is synchronous; run it the way a caller on the event loop would have to
+        await asyncio.to_thread(prompt.getAgentDetails, f"bench-agent-{i}" if cold else "bench-agent")
+
+    async def lookup_knowledgebase(i: int, cold: bool) -> None:
+        query = f"how does the {run_id} {i} integration pricing work" if cold else "how does pricing work"
+        await assistant.lookup_knowledgebase(None, query)
+
+    ttfts: list[float] = []
+
+    async def chat(i: int, cold: bool) -> None:
+        chat_ctx = llm.ChatContext.empty()
+        chat_ctx.add_message(role="system", content=config.system_prompt)
+        chat_ctx.add_message(role="user", content=f"Tell me about plan {i}")
+        start = time.perf_counter()
+        first = True
+        async with chat_llm.chat(chat_ctx=chat_ctx) as stream:
+            async for chunk in stream:
+                if first and chunk.delta and chunk.delta.content:
+                    ttfts.append(time.perf_counter() - start)
+                    first = False
+
+    fncs = {
+        "agent_config": agent_config,
+        "agent_details": agent_details,
+        "lookup_knowledgebase": lookup_knowledgebase,
+        "chat": chat,
+    }
+
+    results: dict = {}
+    try:
+        for name in args.scenarios.split(","):
+            fnc = fncs[name]
+            results[name] = {}
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                for mode in ("cold", "warm") if name != "chat" else ("cold",):
+                    reset_caches()
+                    run_id += 1
+                    ttfts.clear()
+                    stats = await run_load(
+                        lambda i, fnc=fnc, cold=(mode == "cold"): fnc(i, cold),
+                        requests=args.requests,
+                        concurrency=concurrency,
+                    )
+                    if name == "chat" and ttfts:
+                        stats["ttft_p50_ms"] = round(statistics.median(ttfts) * 1000, 2)
+                    results[name][f"{mode}@{concurrency}"] = stats
+    finally:
+        await chat_llm.aclose()
+        await registry.aclose()
+        await services.aclose()
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "token_delay_ms": args.token_delay_ms,
+            "tokens": args.tokens,
+            "documents": args.documents,
+        },
+        "upstream_requests": services.requests,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=20, help="latency injected into every upstream response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="uniform jitter around the injected latency")
+    parser.add_argument("--token-delay-ms", type=float, default=0, help="delay between streamed chat tokens")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per streamed chat response")
+    parser.add_argument("--documents", type=int, default=500, help="documents seeded into Qdrant")
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(bench(args))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Local stand-ins for the external services used by the agent.
+
+``FakeServices`` runs one aiohttp server that answers like the Breezeflow agent
+API, the Breezeflow streaming chat API, the Azure OpenAI embeddings API and the
+LiveKit ``RoomService.GetParticipant`` call.
+Every response can be delayed to simulate upstream latency. Qdrant runs in
+local mode (``QDRANT_URL=:memory:``) and is seeded with ``seed_qdrant``.
+Point the agent at the fakes with the variables returned by ``env()``.
+"""
+from __future__ import annotations
+
+import json
+import random
+import asyncio
+import hashlib
+
+import numpy as np
+from aiohttp import web
+
+COLLECTION_NAME = "bench-knowledgebase"
+COMPANY_ID = "bench-company"
+EMBEDDING_DIM = 256
+
+WORDS = [
+    "pricing", "plans", "integration", "onboarding", "support", "security", "export",
+    "billing", "widget", "analytics", "languages", "api", "trial", "refund", "team",
+]
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list[float]:
+    """Deterministic unit vector for ``text``."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def documents(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [f"Document {i} about " + " ".join(rng.choices(WORDS, k=12)) for i in range(count)]
+
+
+async def seed_qdrant(client, count: int, *, dim: int = EMBEDDING_DIM) -> None:
+    """Create the benchmark collection in a local-mode Qdrant client."""
+    from qdrant_client import models
+
+    if await client.collection_exists(COLLECTION_NAME):
+        await client.delete_collection(COLLECTION_NAME)
+    await client.create_collection(
+        COLLECTION_NAME,
+        vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE),
+    )
+    await client.upsert(
+        COLLECTION_NAME,
+        points=[
+            models.PointStruct(
+                id=i,
+                vector=fake_embedding(text, dim),
+                payload={"companyId": COMPANY_ID, "content": text},
+            )
+            for i, text in enumerate(documents(count))
+        ],
+    )
+
+
+class FakeServices:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        token_delay: float = 0.0,
+        tokens: int = 40,
+        dim: int = EMBEDDING_DIM,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.dim = dim
+        self.requests = {"agent": 0, "embeddings": 0, "chat": 0, "participant": 0, "speech": 0}
+
+        self._rng = random.Random(seed)
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get("/api/v1/agent", self._agent),
+            web.post("/openai/deployments/{deployment}/embeddings", self._embeddings),
+            web.post("/api/agent/chat", self._chat),
+            web.post("/twirp/livekit.RoomService/GetParticipant", self._participant),
+            web.post("/v1/audio/speech", self._speech),
+        ])
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def aclose(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def env(self) -> dict[str, str]:
+        return {
+            "BREEZE_API_URL": self.url,
+            "AZURE_OPENAI_ENDPOINT": self.url,
+            "AZURE_OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "QDRANT_URL": ":memory:",
+            "LIVEKIT_URL": self.url.replace("http://", "ws://", 1),
+            "LIVEKIT_API_KEY": "bench",
+            "LIVEKIT_API_SECRET": "bench-secret-bench-secret-bench-secret",
+        }
+
+    async def _delay(self) -> None:
+        delay = self.latency + (self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _agent(self, request: web.Request) -> web.Response:
+        self.requests["agent"] += 1
+        await self._delay()
+        agent_id = request.query.get("id", "")
+        return web.json_response({
+            "data": {
+                "name": f"Bench agent {agent_id}",
+                "description": "A benchmark agent",
+                "tone": "Friendly",
+                "company": {"_id": COMPANY_ID, "company_name": "Bench Inc."},
+                "KnowledgeBase": [{"collectionName": COLLECTION_NAME, "updatedAt": "2024-01-01T00:00:00Z"}],
+            }
+        })
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        self.requests["embeddings"] += 1
+        body = await request.json()
+        await self._delay()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        tokens = sum(len(text.split()) for text in inputs)
+        return web.json_response({
+            "object": "list",
+            "model": request.match_info["deployment"],
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, self.dim)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    async def _participant(self, request: web.Request) -> web.Response:
+        from livekit.protocol import models, room
+
+        self.requests["participant"] += 1
+        identity = room.RoomParticipantIdentity.FromString(await request.read()).identity
+        await self._delay()
+        info = models.ParticipantInfo(identity=identity, name="bench-agent", metadata="{}")
+        return web.Response(body=info.SerializeToString(), content_type="application/protobuf")
+
+    async def _speech(self, request: web.Request) -> web.Response:
+        self.requests["speech"] += 1
+        body = await request.json()
+        await self._delay()
+        # a quiet 24kHz mono tone, roughly as long as the text takes to say
+        seconds = max(0.5, len(body.get("input", "").split()) / 2.5)
+        samples = (np.sin(np.arange(int(seconds * 24000)) / 20) * 2000).astype(np.int16)
+        return web.Response(body=samples.tobytes(), content_type="audio/pcm")
+
+    async def _chat(self, request: web.Request) -> web.StreamResponse:
+        self.requests["chat"] += 1
+        body = await request.json()
+        await self._delay()
+
+        response = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+        await response.prepare(request)
+        await response.write(b'f:{"messageId":"msg-bench"}\n')
+        for i in range(self.tokens):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            await response.write(b"0:" + json.dumps(f" {WORDS[i % len(WORDS)]}").encode() + b"\n")
+
+        prompt_tokens = sum(len(m.get("text", "").split()) for m in body.get("messages", []))
+        usage = {"promptTokens": prompt_tokens, "completionTokens": self.tokens}
+        await response.write(b"d:" + json.dumps({"finishReason": "stop", "usage": usage}).encode() + b"\n")
+        await response.write_eof()
+        return response
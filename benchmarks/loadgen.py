@@ -0,0 +1,392 @@
+"""Multi-room load generator for ``agent.entrypoint``.
+
+Runs the real entrypoint for many simulated rooms in one process, like a
+worker job process would. Several pieces are replaced:
+
+- the LiveKit room, participant, job context and ``AgentSession`` are mocked;
+- the participant publishes a synthetic video track;
+- each session pumps 20ms audio frames through a resampler;
+- simulated user turns emit transcripts and state changes, attach video frames
+  and call the ``lookup_knowledgebase`` tool;
+- all upstream services are the local fakes from ``fakes.py``.
+
+Rooms are added in steps. After each step settles the tool measures:
+
+- event-loop lag
+- lateness of the 20ms audio ticks (what users hear as stutter)
+- CPU and RSS per room
+- per-stage latency from the session tracers
+
+It then recommends the largest step that stays within the lag, audio, CPU
+and memory budgets.
+
+    python benchmarks/loadgen.py --rooms 5,10,20,40 --duration 20
+    python benchmarks/loadgen.py --rooms 10,25,50 --latency-ms 80 --memory-mb 2048 --output load.json
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+from contextvars import ContextVar
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# must be set before the agent modules read them at import time
+os.environ["QDRANT_URL"] = ":memory:"
+os.environ.setdefault("EMBEDDING_CACHE_DIR", tempfile.mkdtemp(prefix="loadgen-embeddings-"))
+os.environ.setdefault("AGENT_CONFIG_CACHE_DIR", tempfile.mkdtemp(prefix="loadgen-agents-"))
+os.environ.setdefault("OPENAI_API_KEY", "loadgen")
+os.environ.setdefault("AUDIO_CACHE_DIR", tempfile.mkdtemp(prefix="loadgen-audio-"))
+
+from livekit import rtc  # noqa: E402
+from livekit.agents.llm import ChatContext, ChatMessage  # noqa: E402
+
+from fakes import FakeServices, seed_qdrant  # noqa: E402
+
+QUESTIONS = [
+    "what does the pro plan cost per month",
+    "do you integrate with our billing system",
+    "how long does onboarding usually take",
+    "is there a free trial for teams",
+    "which languages does the widget support",
+    "can I export analytics to a spreadsheet",
+    "how do refunds work if we cancel",
+    "what security certifications do you have",
+]
+
+_current_ctx: ContextVar["FakeJobContext"] = ContextVar("loadgen_job_context")
+_stage_samples: dict[str, list[float]] = {}
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class FakeVideoStream:
+    """Stands in for ``rtc.VideoStream``: yields synthetic frames whose scene changes every few seconds."""
+
+    def __init__(self, track, *, capacity: int = 0, fps: float = 15, width: int = 1280, height: int = 720) -> None:
+        self._interval = 1.0 / fps
+        self._width, self._height = width, height
+        self._closed = False
+
+    def __aiter__(self):
+        return self._frames()
+
+    async def _frames(self):
+        # a few pre-rendered scenes, so generating frames costs the loop next to nothing
+        rng = np.random.default_rng()
+        scenes = [rng.integers(0, 255, self._width * self._height * 4, dtype=np.uint8).tobytes() for _ in range(3)]
+        frames = 0
+        while not self._closed:
+            await asyncio.sleep(self._interval)
+            frames += 1
+            scene = scenes[int(frames * self._interval / 5) % len(scenes)]
+            frame = rtc.VideoFrame(self._width, self._height, rtc.VideoBufferType.RGBA, scene)
+            yield SimpleNamespace(frame=frame)
+
+    async def aclose(self) -> None:
+        self._closed = True
+
+
+class FakeRoom(rtc.EventEmitter):
+    def __init__(self, name: str, participant) -> None:
+        super().__init__()
+        self.name = name
+        self.remote_participants = {participant.identity: participant}
+
+
+class FakeJobContext:
+    def __init__(self, room_name: str) -> None:
+        video = SimpleNamespace(kind=rtc.TrackKind.KIND_VIDEO, sid=f"TR_{room_name}")
+        self.participant = SimpleNamespace(
+            identity=f"user-{room_name}",
+            name="bench-agent",
+            track_publications={video.sid: SimpleNamespace(track=video)},
+        )
+        self.room = FakeRoom(room_name, self.participant)
+        self.job = SimpleNamespace(room=SimpleNamespace(name=room_name))
+        self.proc = SimpleNamespace(userdata={})
+        self._shutdown_callbacks = []
+
+    async def connect(self) -> None:
+        await asyncio.sleep(0)
+
+    async def wait_for_participant(self):
+        return self.participant
+
+    def add_shutdown_callback(self, callback) -> None:
+        self._shutdown_callbacks.append(callback)
+
+    async def shutdown(self) -> None:
+        for callback in reversed(self._shutdown_callbacks):
+            await callback()
+
+
+class FakeSession(rtc.EventEmitter):
+    """Stands in for ``AgentSession``: simulates audio input and user turns against the real agent."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__()
+        self._tasks: list[asyncio.Task] = []
+        self.agent = None
+
+    async def start(self, *, room, agent, **kwargs) -> None:
+        self.agent = agent
+        await agent.on_enter()
+        self._tasks.append(asyncio.create_task(pump_audio()))
+        self._tasks.append(asyncio.create_task(self._turns()))
+
+    async def generate_reply(self, instructions: str = "") -> None:
+        await self._speak(1.0)
+
+    async def say(self, text: str, *, audio=None, **kwargs) -> None:
+        seconds = 0.0
+        if audio is not None:
+            async for frame in audio:
+                seconds += frame.duration
+        await self._speak(seconds or 1.0)
+
+    async def aclose(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        await self.agent.on_exit()
+
+    async def _speak(self, seconds: float) -> None:
+        self.emit("agent_state_changed", SimpleNamespace(old_state="thinking", new_state="speaking"))
+        await asyncio.sleep(seconds)
+        self.emit("agent_state_changed", SimpleNamespace(old_state="speaking", new_state="listening"))
+
+    async def _turns(self) -> None:
+        rng = random.Random()
+        while True:
+            await asyncio.sleep(rng.uniform(1.0, 3.0))
+            question = rng.choice(QUESTIONS)
+
+            self.emit("user_state_changed", SimpleNamespace(old_state="listening", new_state="speaking"))
+            words = question.split()
+            for i in range(1, len(words) + 1):
+                await asyncio.sleep(0.25)
+                is_final = i == len(words)
+                self.emit("user_input_transcribed", SimpleNamespace(transcript=" ".join(words[:i]), is_final=is_final))
+            self.emit("user_state_changed", SimpleNamespace(old_state="speaking", new_state="listening"))
+
+            message = ChatMessage(role="user", content=[question])
+            await self.agent.on_user_turn_completed(ChatContext.empty(), message)
+            if rng.random() < LOAD.tool_ratio:
+                try:
+                    await self.agent.lookup_knowledgebase(None, question)
+                except Exception:
+                    pass
+            await self._speak(rng.uniform(2.0, 4.0))
+
+
+LOAD = SimpleNamespace(tool_ratio=0.5, audio_lateness=[])
+
+
+async def pump_audio() -> None:
+    """Push 20ms frames through a 48k -> 24k resampler, recording how late each tick fires."""
+    resampler = rtc.AudioResampler(48000, 24000, num_channels=1)
+    samples = np.random.default_rng().integers(-2000, 2000, 960, dtype=np.int16).tobytes()
+    next_tick = time.perf_counter()
+    while True:
+        next_tick += 0.02
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+        LOAD.audio_lateness.append(max(0.0, time.perf_counter() - next_tick))
+        resampler.push(rtc.AudioFrame(samples, 48000, 1, 960))
+
+
+async def measure_loop_lag(samples: list[float], interval: float = 0.05) -> None:
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def run(args: argparse.Namespace) -> dict:
+    services = FakeServices(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000)
+    await services.start()
+    os.environ.update(services.env())
+    os.environ["SPECULATIVE_PREFETCH"] = "true" if args.prefetch else "false"
+    LOAD.tool_ratio = args.tool_ratio
+
+    import agent
+    from clients import registry
+    from metrics import SessionTracer
+
+    class RecordingTracer(SessionTracer):
+        def record(self, stage: str, seconds: float) -> None:
+            super().record(stage, seconds)
+            _stage_samples.setdefault(stage, []).append(seconds)
+
+    await seed_qdrant(registry.qdrant, args.documents)
+    # create the upstream clients once up front; their one-off setup would otherwise stall the first step
+    import prompt
+    await prompt.getEmbedding("loadgen warm up")
+
+    process = psutil.Process()
+    loop_lag: list[float] = []
+    lag_task = asyncio.create_task(measure_loop_lag(loop_lag))
+    rooms: list[tuple[FakeJobContext, asyncio.Task]] = []
+    sessions: list[FakeSession] = []
+
+    def make_session(**kwargs) -> FakeSession:
+        session = FakeSession(**kwargs)
+        sessions.append(session)
+        return session
+
+    async def start_room(i: int) -> None:
+        ctx = FakeJobContext(f"loadgen-room-{i}")
+        _current_ctx.set(ctx)
+        await agent.entrypoint(ctx)
+        rooms.append((ctx, asyncio.current_task()))
+
+    steps = []
+    baseline_rss = process.memory_info().rss
+    patches = [
+        mock.patch.object(agent, "AgentSession", make_session),
+        mock.patch.object(agent, "SessionTracer", RecordingTracer),
+        mock.patch.object(agent, "get_job_context", lambda: _current_ctx.get()),
+        mock.patch.object(rtc, "VideoStream", lambda track, capacity=0: FakeVideoStream(track, capacity=capacity, fps=args.video_fps)),
+    ]
+    for patch in patches:
+        patch.start()
+
+    try:
+        started = 0
+        for target in (int(n) for n in args.rooms.split(",")):
+            while started < target:
+                asyncio.create_task(start_room(started))
+                started += 1
+                await asyncio.sleep(args.ramp_interval)
+            await asyncio.sleep(args.settle)
+
+            loop_lag.clear()
+            LOAD.audio_lateness.clear()
+            _stage_samples.clear()
+            process.cpu_percent()
+            await asyncio.sleep(args.duration)
+            cpu = process.cpu_percent()
+            rss = process.memory_info().rss
+
+            step = {
+                "rooms": target,
+                "cpu_percent": round(cpu, 1),
+                "cpu_percent_per_room": round(cpu / target, 2),
+                "rss_mb": round(rss / 2**20, 1),
+                "rss_mb_per_room": round((rss - baseline_rss) / 2**20 / target, 2),
+                "loop_lag_p50_ms": round(percentile(loop_lag, 0.50) * 1000, 2),
+                "loop_lag_p99_ms": round(percentile(loop_lag, 0.99) * 1000, 2),
+                "loop_lag_max_ms": round(max(loop_lag, default=0.0) * 1000, 2),
+                "audio_tick_late_p99_ms": round(percentile(LOAD.audio_lateness, 0.99) * 1000, 2),
+                "stages": {
+                    stage: {
+                        "count": len(values),
+                        "p50_ms": round(statistics.median(values) * 1000, 2),
+                        "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+                    }
+                    for stage, values in sorted(_stage_samples.items())
+                },
+            }
+            step["healthy"] = (
+                step["loop_lag_p99_ms"] <= args.max_loop_lag_ms
+                and step["audio_tick_late_p99_ms"] <= args.max_audio_late_ms
+                and step["cpu_percent"] <= args.cpu_budget
+            )
+            steps.append(step)
+            print(json.dumps(step), file=sys.stderr)
+            if not step["healthy"] and args.stop_on_unhealthy:
+                break
+    finally:
+        for session in sessions:
+            await session.aclose()
+        for ctx, _ in rooms:
+            await ctx.shutdown()
+        for patch in patches:
+            patch.stop()
+        lag_task.cancel()
+        await registry.aclose()
+        await services.aclose()
+        sessions.clear()
+        rooms.clear()
+        # release native frame and resampler handles while the FFI client is still alive
+        gc.collect()
+
+    return {
+        "config": vars(args),
+        "steps": steps,
+        "recommendation": recommend(steps, args),
+    }
+
+
+def recommend(steps: list[dict], args: argparse.Namespace) -> dict:
+    healthy = [step["rooms"] for step in steps if step["healthy"]]
+    measured = max(healthy, default=0)
+
+    # worst per-room cost seen across steps, used to extrapolate past the largest step measured
+    per_room_cpu = max((step["cpu_percent_per_room"] for step in steps), default=0.0)
+    per_room_rss = max((step["rss_mb_per_room"] for step in steps), default=0.0)
+    by_cpu = int(args.cpu_budget / per_room_cpu) if per_room_cpu else None
+    by_memory = int(args.memory_mb / per_room_rss) if args.memory_mb and per_room_rss > 0 else None
+
+    limits = [n for n in (by_cpu, by_memory) if n is not None]
+    if steps and steps[-1]["healthy"] and limits:
+        # every step passed, the budgets bound the figure instead
+        recommended = max(measured, min(limits))
+    else:
+        recommended = measured
+
+    return {
+        "max_rooms_per_process": recommended,
+        "largest_healthy_step": measured,
+        "cpu_bound_rooms": by_cpu,
+        "memory_bound_rooms": by_memory,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", default="1,5,10,20", help="comma separated room counts to step through")
+    parser.add_argument("--duration", type=float, default=15, help="measurement window per step, seconds")
+    parser.add_argument("--settle", type=float, default=5, help="wait after adding rooms before measuring, seconds")
+    parser.add_argument("--ramp-interval", type=float, default=0.1, help="delay between starting rooms, seconds")
+    parser.add_argument("--latency-ms", type=float, default=40, help="latency injected into every upstream response")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="uniform jitter around the injected latency")
+    parser.add_argument("--tool-ratio", type=float, default=0.5, help="fraction of turns that call the knowledge base")
+    parser.add_argument("--video-fps", type=float, default=15, help="frame rate of the synthetic video tracks")
+    parser.add_argument("--documents", type=int, default=500, help="documents seeded into Qdrant")
+    parser.add_argument("--prefetch", action="store_true", help="enable speculative knowledge-base prefetch")
+    parser.add_argument("--max-loop-lag-ms", type=float, default=50, help="p99 event-loop lag budget")
+    parser.add_argument("--max-audio-late-ms", type=float, default=20, help="p99 audio tick lateness budget")
+    parser.add_argument("--cpu-budget", type=float, default=70, help="CPU budget in percent of one core")
+    parser.add_argument("--memory-mb", type=float, default=0, help="memory available to one process, MB (instance type)")
+    parser.add_argument("--stop-on-unhealthy", action="store_true", help="stop at the first step over budget")
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,11 @@ from dataclasses import dataclass
 
 from livekit.agents import (
     APIConnectionError, 
+    APIError,
     APIStatusError,
     APITimeoutError,
     llm,
+    utils,
 )
 from livekit.agents.types import (
     NOT_GIVEN,
@@ -20,12 +22,19 @@ from livekit.agents.types import (
     DEFAULT_API_CONNECT_OPTIONS
 )
 
+from datastream import DataStreamParser, DataStreamPart
+from metrics import observe
+
 logger = logging.getLogger(__name__)
 
 @dataclass
 class _LLMOptions:
     chatbot_id: str
     api_url: str
+    pool_size: int
+    keepalive_timeout: float
+    max_history_tokens: int | None
+    summarize_history: bool
 
 class LLM(llm.LLM):
     def __init__(
@@ -33,12 +42,54 @@ class LLM(llm.LLM):
         *,
         chatbot_id: str,
         api_url: str = "https://breezeflow.io/api/agent/chat",
+        http_session: aiohttp.ClientSession | None = None,
+        pool_size: int = 20,
+        keepalive_timeout: float = 60.0,
+        max_history_tokens: int | None = 4000,
+        summarize_history: bool = False,
     ) -> None:
+        """
+        Args:
+            http_session: optional pooled session shared across streams (e.g. the
+                worker's ``clients.registry.http``). It is owned by the caller and
+                never closed by the LLM. When omitted, the LLM lazily creates its
+                own keepalive session and closes it in ``aclose()``.
+            pool_size: maximum open connections of the LLM-owned session.
+            keepalive_timeout: seconds an idle connection is kept open for reuse.
+            max_history_tokens: approximate token budget for the history sent with
+                each turn. System messages are always kept, then the most recent
+                turns that fit. ``None`` sends the full transcript.
+            summarize_history: replace turns that fall outside the budget with a
+                short extractive summary instead of dropping them silently.
+        """
         super().__init__()
         self._opts = _LLMOptions(
             chatbot_id=chatbot_id,
             api_url=api_url,
+            pool_size=pool_size,
+            keepalive_timeout=keepalive_timeout,
+            max_history_tokens=max_history_tokens,
+            summarize_history=summarize_history,
         )
+        self._http_session = http_session
+        self._owns_session = http_session is None
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self._opts.pool_size,
+                    keepalive_timeout=self._opts.keepalive_timeout,
+                    ttl_dns_cache=300,
+                ),
+            )
+            self._owns_session = True
+        return self._http_session
+
+    async def aclose(self) -> None:
+        if self._owns_session and self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
 
     def chat(
         self,
@@ -46,16 +97,17 @@ class LLM(llm.LLM):
         chat_ctx: llm.ChatContext,
         tools: list | None = None,
         conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        parallel_tool_calls: NotGivenOr[bool] = NOT_GIVEN,
+        tool_choice: NotGivenOr[llm.ToolChoice] = NOT_GIVEN,
         extra_kwargs: NotGivenOr[dict[str, Any]] = NOT_GIVEN,
-        fnc_ctx: Any = None,
     ) -> LLMStream:
         return LLMStream(
             self,
             chatbot_id=self._opts.chatbot_id,
             api_url=self._opts.api_url,
             chat_ctx=chat_ctx,
+            tools=tools or [],
             conn_options=conn_options,
-            fnc_ctx=fnc_ctx,
         )
 
 class LLMStream(llm.LLMStream):
@@ -66,60 +118,171 @@ class LLMStream(llm.LLMStream):
         chatbot_id: str,
         api_url: str,
         chat_ctx: llm.ChatContext,
+        tools: list,
         conn_options: APIConnectOptions,
-        fnc_ctx: Any = None,
     ) -> None:
         super().__init__(
             llm=llm, 
             chat_ctx=chat_ctx, 
+            tools=tools,
             conn_options=conn_options,
-            fnc_ctx=fnc_ctx
         )
         self._chatbot_id = chatbot_id
         self._api_url = api_url
 
     async def _run(self) -> None:
-        messages = []
-        for msg in self._chat_ctx.messages:
-            messages.append({
-                "id": str(time.time()),
-                "text": msg.content,
-                "role": "assistant" if msg.role == "model" else msg.role
-            })
+        opts = self._llm._opts
+        all_messages = _serialize_messages(self._chat_ctx)
+        messages = _compact_history(all_messages, opts.max_history_tokens, opts.summarize_history)
+        body = json.dumps({
+            "message": messages[-1]["text"] if messages else "",
+            "messages": messages,
+        }).encode()
+        logger.info(f"Breezeflow request: {len(body)} bytes, {len(messages)} of {len(all_messages)} messages")
 
+        # connections are kept alive and reused across turns by the LLM's session
+        session = self._llm._ensure_session()
+        started_at = time.perf_counter()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self._api_url}?id={self._chatbot_id}",
-                    headers={"Content-Type": "application/json"},
-                    json={
-                        "message": messages[-1]["text"],
-                        "messages": messages,
-                    }
-                ) as response:
-                    if not response.ok:
-                        raise APIStatusError(
-                            f"Breezeflow API error: {response.status}",
-                            status_code=response.status,
-                            request_id="",
-                            body="",
-                            retryable=True
-                        )
-
-                    async for line in response.content:
-                        line = line.decode().strip()
-                        if line and line.startswith("0:"):
-                            try:
-                                content = json.loads(line[2:])
-                                chunk = llm.ChatChunk(
-                                    request_id=str(time.time()),
-                                    choices=[llm.Choice(delta=llm.ChoiceDelta(role="assistant", content=content))]
-                                )
-                                self._event_ch.send_nowait(chunk)
-                            except json.JSONDecodeError:
-                                continue
+            async with session.post(
+                f"{self._api_url}?id={self._chatbot_id}",
+                headers={"Content-Type": "application/json"},
+                data=body,
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    sock_connect=self._conn_options.timeout,
+                    sock_read=self._conn_options.timeout,
+                ),
+            ) as response:
+                if not response.ok:
+                    raise APIStatusError(
+                        f"Breezeflow API error: {response.status}",
+                        status_code=response.status,
+                        request_id="",
+                        body="",
+                        retryable=True
+                    )
 
+                request_id = response.headers.get("x-request-id") or utils.shortuuid("breezeflow_")
+                parser = DataStreamParser()
+                first_token = True
+                async for data in response.content.iter_any():
+                    parts = parser.feed(data)
+                    if first_token and any(part.type == "text" for part in parts):
+                        observe("breezeflow_ttft", time.perf_counter() - started_at)
+                        first_token = False
+                    for part in parts:
+                        self._handle_part(request_id, part)
+                for part in parser.flush():
+                    self._handle_part(request_id, part)
+
+        except APIError:
+            raise
         except aiohttp.ClientError as e:
             raise APITimeoutError(retryable=True) from e
         except Exception as e:
             raise APIConnectionError(retryable=True) from e
+
+    def _handle_part(self, request_id: str, part: DataStreamPart) -> None:
+        if part.type == "text":
+            self._event_ch.send_nowait(llm.ChatChunk(
+                id=request_id,
+                delta=llm.ChoiceDelta(role="assistant", content=part.value),
+            ))
+        elif part.type == "tool_call":
+            self._event_ch.send_nowait(llm.ChatChunk(
+                id=request_id,
+                delta=llm.ChoiceDelta(
+                    role="assistant",
+                    tool_calls=[llm.FunctionToolCall(
+                        call_id=part.value["toolCallId"],
+                        name=part.value["toolName"],
+                        arguments=json.dumps(part.value.get("args", {})),
+                    )],
+                ),
+            ))
+        elif part.type == "finish_message":
+            usage = part.value.get("usage") or {}
+            prompt_tokens = usage.get("promptTokens") or 0
+            completion_tokens = usage.get("completionTokens") or 0
+            self._event_ch.send_nowait(llm.ChatChunk(
+                id=request_id,
+                usage=llm.CompletionUsage(
+                    completion_tokens=completion_tokens,
+                    prompt_tokens=prompt_tokens,
+                    total_tokens=prompt_tokens + completion_tokens,
+                ),
+            ))
+        elif part.type == "error":
+            raise APIError(f"Breezeflow stream error: {part.value}", body=part.value, retryable=False)
+
+
+_SYSTEM_ROLES = ("system", "developer")
+
+
+def _estimate_tokens(message: dict) -> int:
+    # roughly four characters per token for English text, plus per-message overhead
+    return len(message["text"]) // 4 + 4
+
+
+def _serialize_messages(chat_ctx: llm.ChatContext) -> list[dict]:
+    messages = []
+    for item in chat_ctx.items:
+        if item.type != "message":
+            continue
+        # only text is sent; images attached to earlier turns are dropped from history
+        text = item.text_content
+        if not text:
+            continue
+        messages.append({
+            "id": item.id,
+            "text": text,
+            "role": "assistant" if item.role == "model" else item.role,
+        })
+    return messages
+
+
+def _compact_history(messages: list[dict], max_tokens: int | None, summarize: bool) -> list[dict]:
+    """Keep system messages and the most recent turns that fit in ``max_tokens``."""
+    if max_tokens is None:
+        return messages
+
+    system = [m for m in messages if m["role"] in _SYSTEM_ROLES]
+    conversation = [m for m in messages if m["role"] not in _SYSTEM_ROLES]
+
+    budget = max_tokens - sum(_estimate_tokens(m) for m in system)
+    kept = []
+    for message in reversed(conversation):
+        cost = _estimate_tokens(message)
+        # the latest message is always sent, even when it alone exceeds the budget
+        if kept and cost > budget:
+            break
+        kept.append(message)
+        budget -= cost
+    kept.reverse()
+
+    compacted = list(system)
+    dropped = conversation[:len(conversation) - len(kept)]
+    if dropped and summarize and budget > 0:
+        compacted.append(_summarize(dropped, max_chars=budget * 4))
+    return compacted + kept
+
+
+def _summarize(messages: list[dict], *, max_chars: int) -> dict:
+    lines = []
+    used = 0
+    for message in reversed(messages):
+        first_sentence = message["text"].strip().split("\n")[0].split(". ")[0][:120]
+        line = f"{message['role'].capitalize()}: {first_sentence}"
+        if used + len(line) > max_chars:
+            break
+        lines.append(line)
+        used += len(line) + 1
+    lines.reverse()
+
+    return {
+        # stable for as long as the same prefix of the conversation is summarized
+        "id": f"summary-{messages[-1]['id']}",
+        "text": "Summary of earlier conversation:\n" + "\n".join(lines),
+        "role": "system",
+    }
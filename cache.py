@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+import numpy as np
+
+from metrics import cache_events
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire ``ttl`` seconds after insertion."""
+
+    def __init__(self, *, maxsize: int, ttl: float) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self._ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key onto one in-flight task.
+
+    Callers are shielded from each other: cancelling one waiter never cancels
+    the shared task, which keeps running for the remaining waiters. Once every
+    waiter has been cancelled the shared task is cancelled too, so abandoned
+    work (e.g. a superseded speculative query) stops.
+
+    Calls are only coalesced within one event loop. With livekit's default
+    process-per-job executor that means within one room's job process (its
+    entrypoint, tools and prefetches); rooms never share a flight. Under
+    ``JobExecutorType.THREAD`` each job runs its own loop and gets its own
+    flights rather than awaiting a future bound to another loop. Work that
+    concurrent rooms should share goes through ``SharedFileCache``.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict[tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Future[Any]] = {}
+        self._waiters: dict[asyncio.Future[Any], int] = {}
+
+    async def do(self, key: Hashable, fnc: Callable[[], Awaitable[Any]]) -> Any:
+        flight_key = (asyncio.get_running_loop(), key)
+        fut = self._inflight.get(flight_key)
+        if fut is None:
+            fut = asyncio.ensure_future(fnc())
+            self._inflight[flight_key] = fut
+
+            def _forget(f: asyncio.Future[Any]) -> None:
+                if self._inflight.get(flight_key) is f:
+                    del self._inflight[flight_key]
+                # mark the exception as retrieved in case every waiter was cancelled
+                if not f.cancelled():
+                    f.exception()
+
+            fut.add_done_callback(_forget)
+
+        self._waiters[fut] = self._waiters.get(fut, 0) + 1
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            if self._waiters[fut] == 1 and not fut.done():
+                fut.cancel()
+            raise
+        finally:
+            self._waiters[fut] -= 1
+            if not self._waiters[fut]:
+                del self._waiters[fut]
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+class SharedFileCache:
+    """JSON values shared by the job processes of a host through files in ``path``.
+
+    ``SingleFlight`` and ``TTLCache`` live in one job process, which under the
+    default executor serves one room. This cache spans rooms: ``do`` returns a
+    value written by any process less than ``ttl`` seconds ago, and a missing
+    value is computed once per host. The first process takes a per-key lock
+    file and calls ``fnc``; the others poll for its result until it is written,
+    or take over if the lock is released without one (e.g. the call failed).
+    Without ``fcntl`` every process computes its own value.
+    """
+
+    def __init__(self, path: str, *, ttl: float, poll_interval: float = 0.05) -> None:
+        self._path = path
+        self._ttl = ttl
+        self._poll_interval = poll_interval
+
+    def get(self, key: str) -> Any:
+        """Return the value if it is fresh, reading its file on the calling thread."""
+        try:
+            file = self._file(key)
+            if time.time() - os.path.getmtime(file) >= self._ttl:
+                return None
+            with open(file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        os.makedirs(self._path, exist_ok=True)
+        # written under a temporary name, so other processes never read a partial value
+        tmp = f"{self._file(key)}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp, self._file(key))
+
+    async def do(self, key: str, fnc: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            value = await asyncio.to_thread(self.get, key)
+            if value is not None:
+                return value
+
+            lock = await asyncio.to_thread(self._try_lock, key)
+            if lock is not None:
+                try:
+                    # another process may have finished between the read and the lock
+                    value = await asyncio.to_thread(self.get, key)
+                    if value is None:
+                        value = await fnc()
+                        await asyncio.to_thread(self.set, key, value)
+                    return value
+                finally:
+                    lock.close()
+
+            await asyncio.sleep(self._poll_interval)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self._path, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json")
+
+    def _try_lock(self, key: str):
+        os.makedirs(self._path, exist_ok=True)
+        lock = open(f"{self._file(key)}.lock", "a")
+        if fcntl is None:
+            return lock
+        try:
+            # non-blocking, so a waiting caller stays cancellable; closing the file unlocks it
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+
+class _SemanticBucket:
+    def __init__(self, *, capacity: int, dim: int, version: Any) -> None:
+        self.version = version
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        # 0 marks an empty slot; otherwise the monotonic time the entry expires
+        self.expires = np.zeros(capacity, dtype=np.float64)
+        self.results: list[Any] = [None] * capacity
+
+
+class SemanticCache:
+    """Caches search results per key and serves them for near-duplicate queries.
+
+    Each key (e.g. ``(collection, companyId)``) holds up to ``maxsize`` normalized
+    query embeddings in a preallocated matrix; a lookup is a single matrix-vector
+    product and returns the stored result of the closest query whose cosine
+    similarity is at least ``threshold``. A bucket is dropped as soon as it is
+    looked up or written with a different knowledge base ``version``.
+
+    Entries live in process memory. Under the default process-per-job
+    executor that means one session: repeated and paraphrased questions of
+    one conversation are served, other visitors of the company start cold.
+    With a ``name``, hits and misses are exported as ``cache_events``.
+    """
+
+    def __init__(self, *, threshold: float, ttl: float, maxsize: int, max_keys: int = 256, name: str | None = None) -> None:
+        self.name = name
+        self._threshold = threshold
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._max_keys = max_keys
+        self._buckets: OrderedDict[Hashable, _SemanticBucket] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: Hashable, embedding, *, version: Any = None, allow_expired: bool = False) -> Any:
+        """Return the result stored for the closest query, or None.
+
+        ``allow_expired`` also considers entries past their TTL, e.g. as a
+        fallback while the upstream is unavailable.
+        """
+        bucket = self._bucket(key, version)
+        if bucket is None:
+            self._count("miss")
+            return None
+
+        query = _normalize(embedding)
+        if query is None or query.shape[0] != bucket.vectors.shape[1]:
+            self._count("miss")
+            return None
+
+        scores = bucket.vectors @ query
+        if not allow_expired:
+            scores[bucket.expires < time.monotonic()] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < self._threshold:
+            self._count("miss")
+            return None
+
+        self._count("hit")
+        return bucket.results[best]
+
+    def store(self, key: Hashable, embedding, result: Any, *, version: Any = None) -> None:
+        vector = _normalize(embedding)
+        if vector is None:
+            return
+
+        bucket = self._bucket(key, version)
+        if bucket is None or bucket.vectors.shape[1] != vector.shape[0]:
+            bucket = _SemanticBucket(capacity=self._maxsize, dim=vector.shape[0], version=version)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+
+        # empty slots sort first, then the entry closest to expiry (the oldest)
+        slot = int(np.argmin(bucket.expires))
+        bucket.vectors[slot] = vector
+        bucket.expires[slot] = time.monotonic() + self._ttl
+        bucket.results[slot] = result
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        """Drop cached results for ``key``, or for every key when omitted."""
+        if key is None:
+            self._buckets.clear()
+        else:
+            self._buckets.pop(key, None)
+        if self.name is not None:
+            cache_events.labels(cache=self.name, event="invalidated").inc()
+
+    def _count(self, event: str) -> None:
+        if event == "hit":
+            self.hits += 1
+        else:
+            self.misses += 1
+        if self.name is not None:
+            cache_events.labels(cache=self.name, event=event).inc()
+
+    def _bucket(self, key: Hashable, version: Any) -> _SemanticBucket | None:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return None
+        if bucket.version != version:
+            del self._buckets[key]
+            return None
+        self._buckets.move_to_end(key)
+        return bucket
+
+
+def _normalize(embedding) -> np.ndarray | None:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        return None
+    return vector / norm
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import os
+import asyncio
+import logging
+
+import httpx
+import aiohttp
+from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+from livekit import api
+from qdrant_client import AsyncQdrantClient
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Default values for environment variables
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_POOL_SIZE_PER_HOST = int(os.getenv("HTTP_POOL_SIZE_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+
+
+class ClientRegistry:
+    """Owns the connection-pooled upstream clients of a job process.
+
+    Clients are created lazily on first use and bound to the running event loop.
+    Sessions ``acquire()`` the registry when they start and ``release()`` it on
+    shutdown; the clients are closed once the last session has released them,
+    after which the registry refuses new clients and acquisitions on that loop.
+
+    A job's event loop only starts after the process prewarm hook has run, so
+    clients cannot be built there. Under the default process-per-job executor
+    the pools therefore live as long as one session; their DNS, TCP and TLS
+    setup overlaps with waiting for the participant (``warm``). Sessions that
+    share a loop, as in the benchmarks, share the pools.
+    """
+
+    def __init__(
+        self,
+        *,
+        pool_size: int = HTTP_POOL_SIZE,
+        pool_size_per_host: int = HTTP_POOL_SIZE_PER_HOST,
+        keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+    ) -> None:
+        self._pool_size = pool_size
+        self._pool_size_per_host = pool_size_per_host
+        self._keepalive_timeout = keepalive_timeout
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._http: aiohttp.ClientSession | None = None
+        self._livekit: api.LiveKitAPI | None = None
+        self._azure: AsyncAzureOpenAI | None = None
+        self._qdrant: AsyncQdrantClient | None = None
+        self._refs = 0
+        # the loop whose last session released the registry
+        self._released: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        """Shared aiohttp session for the Breezeflow APIs and the LiveKit server API."""
+        self._check_loop()
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self._pool_size,
+                    limit_per_host=self._pool_size_per_host,
+                    keepalive_timeout=self._keepalive_timeout,
+                    ttl_dns_cache=300,
+                ),
+            )
+        return self._http
+
+    @property
+    def livekit(self) -> api.LiveKitAPI:
+        self._check_loop()
+        if self._livekit is None:
+            self._livekit = api.LiveKitAPI(session=self.http)
+        return self._livekit
+
+    @property
+    def azure(self) -> AsyncAzureOpenAI:
+        self._check_loop()
+        if self._azure is None:
+            self._azure = AsyncAzureOpenAI(
+                api_key = os.getenv("AZURE_OPENAI_API_KEY", "your-api-key-here"),
+                api_version = "2024-10-21",
+                azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "https://breezeopenai.openai.azure.com/"),
+                max_retries = 1,
+                http_client = DefaultAsyncHttpxClient(limits=self._httpx_limits()),
+            )
+        return self._azure
+
+    @property
+    def qdrant(self) -> AsyncQdrantClient:
+        self._check_loop()
+        if self._qdrant is None:
+            if QDRANT_URL == ":memory:":
+                # local mode, e.g. for the offline benchmarks; data lives as long as the client
+                self._qdrant = AsyncQdrantClient(location=":memory:")
+            else:
+                self._qdrant = AsyncQdrantClient(
+                    url=QDRANT_URL,
+                    api_key=QDRANT_API_KEY,
+                    limits=self._httpx_limits(),
+                    check_compatibility=False,
+                )
+        return self._qdrant
+
+    async def warm(self, urls: list[str] | None = None) -> None:
+        """Open pooled connections (DNS, TCP, TLS) to the upstreams ahead of the first real request."""
+        urls = list(urls or [])
+        livekit_url = os.getenv("LIVEKIT_URL", "")
+        if livekit_url:
+            urls.append(livekit_url.replace("wss://", "https://", 1).replace("ws://", "http://", 1))
+
+        async def _head(url: str) -> None:
+            try:
+                async with self.http.head(url, timeout=aiohttp.ClientTimeout(total=5)):
+                    pass
+            except Exception as e:
+                logger.debug(f"Failed to warm connection to {url}: {str(e)}")
+
+        await asyncio.gather(*(_head(url) for url in urls))
+
+    def acquire(self) -> None:
+        self._check_loop()
+        self._refs += 1
+
+    async def release(self) -> None:
+        self._refs = max(0, self._refs - 1)
+        if self._refs == 0:
+            self._released = asyncio.get_running_loop()
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        livekit, azure, qdrant, http = self._livekit, self._azure, self._qdrant, self._http
+        self._livekit = self._azure = self._qdrant = self._http = None
+        self._loop = None
+
+        for client in (livekit, azure, qdrant):
+            if client is None:
+                continue
+            try:
+                await (client.aclose() if isinstance(client, api.LiveKitAPI) else client.close())
+            except Exception as e:
+                logger.warning(f"Failed to close {type(client).__name__}: {str(e)}")
+
+        if http is not None and not http.closed:
+            await http.close()
+
+    def _httpx_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self._pool_size,
+            max_keepalive_connections=self._pool_size_per_host,
+            keepalive_expiry=self._keepalive_timeout,
+        )
+
+    def _check_loop(self) -> None:
+        # clients cannot be shared across event loops, e.g. when the process runs a new job loop
+        loop = asyncio.get_running_loop()
+        if loop is self._released:
+            # a late call after shutdown would recreate a client that nobody closes
+            raise RuntimeError("upstream clients were released")
+        if self._loop is not loop:
+            if self._loop is not None:
+                logger.debug("event loop changed, recreating upstream clients")
+            self._loop = loop
+            self._http = self._livekit = self._azure = self._qdrant = None
+
+
+registry = ClientRegistry()
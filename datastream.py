@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Part type codes of the Vercel AI SDK data stream protocol (``<code>:<json>\n``)
+PART_TYPES = {
+    "0": "text",
+    "g": "reasoning",
+    "2": "data",
+    "3": "error",
+    "8": "message_annotations",
+    "9": "tool_call",
+    "a": "tool_result",
+    "b": "tool_call_streaming_start",
+    "c": "tool_call_delta",
+    "d": "finish_message",
+    "e": "finish_step",
+    "f": "start_step",
+    "h": "source",
+    "k": "file",
+}
+
+
+@dataclass(slots=True)
+class DataStreamPart:
+    type: str
+    value: Any
+
+
+class DataStreamParser:
+    """Incremental parser for the Vercel AI SDK data stream protocol.
+
+    Bytes are fed as they arrive from the network; a part is emitted as soon as
+    its terminating newline has been received, so JSON values (and multi-byte
+    UTF-8 characters) split across TCP chunks are reassembled. Each network
+    chunk is decoded once, up to its last newline (always a character boundary
+    in UTF-8), rather than line by line.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[DataStreamPart]:
+        buffer = self._buffer
+        buffer += data
+        end = buffer.rfind(b"\n")
+        if end == -1:
+            return []
+
+        text = buffer[:end].decode("utf-8", errors="replace")
+        del buffer[:end + 1]
+        return self._parse_lines(text)
+
+    def flush(self) -> list[DataStreamPart]:
+        """Parse a final part that was not terminated by a newline."""
+        text = self._buffer.decode("utf-8", errors="replace")
+        self._buffer = bytearray()
+        return self._parse_lines(text)
+
+    def _parse_lines(self, text: str) -> list[DataStreamPart]:
+        parts = []
+        for line in text.split("\n"):
+            # every part type is a single character followed by a colon
+            part_type = PART_TYPES.get(line[:1]) if line[1:2] == ":" else None
+            if part_type is None:
+                if line.strip():
+                    logger.debug(f"Skipping unknown data stream line: {line[:80]!r}")
+                continue
+
+            try:
+                parts.append(DataStreamPart(part_type, json.loads(line[2:])))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed data stream part: {line[:80]!r}")
+        return parts
@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+import asyncio
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import numpy as np
+
+from metrics import cache_events, cache_entries
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalizeText(text: str) -> str:
+    """Normalize a query so trivially different phrasings share a cache entry."""
+    return _WHITESPACE_RE.sub(" ", text).strip().strip("?!.,;:").strip().lower()
+
+
+class EmbeddingCache:
+    """In-memory LRU of query embeddings backed by an append-only on-disk store.
+
+    The disk store lives in ``path``: ``meta.json`` holds the vector dimension
+    and the current generation, whose directory holds ``vectors.f32`` (rows of
+    raw float32, read through a memory map) and ``index.tsv`` (``<key>\\t<row>``
+    lines). Appends are serialized with ``flock`` on a ``lock`` file so that
+    several worker processes can share one directory; entries written by other
+    processes are picked up on the next miss. When a generation reaches
+    ``max_disk_entries`` rows the writer starts a new one, seeded with the
+    embeddings its process used most recently, and the generation before the
+    previous one is deleted.
+
+    ``get`` and ``put`` touch the disk store on the calling thread. On the event
+    loop use ``aget`` and ``put_nowait``, which run disk reads and the locked
+    appends in a worker thread, so a contended ``flock`` never stalls the loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        maxsize: int,
+        path: str | None = None,
+        max_disk_entries: int = 5000,
+        name: str | None = None,
+    ) -> None:
+        self.name = name
+        self._maxsize = maxsize
+        self._path = path
+        self._max_disk_entries = max_disk_entries
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+
+        self._dim: int | None = None
+        self._generation = 0
+        self._index: dict[str, int] = {}
+        self._index_offset = 0
+        self._vectors: np.memmap | None = None
+        # serializes index refreshes and appends between the loop's worker threads
+        self._disk_lock = threading.Lock()
+        self._writes: set[asyncio.Future] = set()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.rotations = 0
+
+        if path:
+            try:
+                os.makedirs(path, exist_ok=True)
+                self._load_meta()
+                self._refresh_index()
+            except Exception as e:
+                logger.warning(f"Embedding cache disk store unavailable: {str(e)}")
+                self._path = None
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(normalizeText(text).encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> np.ndarray | None:
+        key = self.key(text)
+        vector = self._get_memory(key)
+        if vector is None:
+            vector = self._found_on_disk(key, self._read_disk(key))
+        return vector
+
+    async def aget(self, text: str) -> np.ndarray | None:
+        """Like ``get``, reading the disk store in a worker thread."""
+        key = self.key(text)
+        vector = self._get_memory(key)
+        if vector is None:
+            vector = self._found_on_disk(key, await asyncio.to_thread(self._read_disk, key) if self._path else None)
+        return vector
+
+    def put(self, text: str, vector) -> None:
+        key = self.key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+        if self._path and key not in self._index:
+            self._persist(key, vector)
+
+    def put_nowait(self, text: str, vector) -> asyncio.Future | None:
+        """Like ``put``, appending to the disk store in a worker thread without waiting for it."""
+        key = self.key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+        if not self._path or key in self._index:
+            return None
+
+        fut = asyncio.ensure_future(asyncio.to_thread(self._persist, key, vector))
+        self._writes.add(fut)
+        fut.add_done_callback(self._writes.discard)
+        return fut
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._index),
+            "disk_generation": self._generation,
+            "rotations": self.rotations,
+        }
+
+    def _count(self, event: str) -> None:
+        if self.name is not None:
+            cache_events.labels(cache=self.name, event=event).inc()
+
+    def _get_memory(self, key: str) -> np.ndarray | None:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            self._count("hit")
+        return vector
+
+    def _found_on_disk(self, key: str, vector: np.ndarray | None) -> np.ndarray | None:
+        if vector is None:
+            self.misses += 1
+            self._count("miss")
+            return None
+        self._remember(key, vector)
+        self.hits += 1
+        self.disk_hits += 1
+        self._count("disk_hit")
+        return vector
+
+    def _persist(self, key: str, vector: np.ndarray) -> None:
+        try:
+            self._append_disk(key, vector)
+        except Exception as e:
+            logger.warning(f"Failed to persist embedding: {str(e)}")
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._maxsize:
+            self._memory.popitem(last=False)
+
+    def _file(self, name: str, generation: int | None = None) -> str:
+        return os.path.join(self._path, str(self._generation if generation is None else generation), name)
+
+    def _load_meta(self) -> None:
+        meta_path = os.path.join(self._path, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self._dim = meta["dim"]
+        generation = meta.get("generation", 0)
+        if generation != self._generation:
+            # another process started a new generation
+            self._generation = generation
+            self._index = {}
+            self._index_offset = 0
+            self._vectors = None
+
+    def _write_meta(self) -> None:
+        meta_path = os.path.join(self._path, "meta.json")
+        with open(f"{meta_path}.{os.getpid()}", "w") as f:
+            json.dump({"dim": self._dim, "generation": self._generation}, f)
+        os.replace(f"{meta_path}.{os.getpid()}", meta_path)
+
+    def _refresh_index(self) -> None:
+        self._load_meta()
+        index_path = self._file("index.tsv")
+        if not os.path.exists(index_path) or os.path.getsize(index_path) == self._index_offset:
+            return
+
+        with open(index_path, "rb") as f:
+            f.seek(self._index_offset)
+            for line in f:
+                # a partially written line from a concurrent writer is picked up next time
+                if not line.endswith(b"\n"):
+                    break
+                key, row = line.decode().split("\t")
+                self._index[key] = int(row)
+                self._index_offset += len(line)
+
+        if self._index and self._dim:
+            rows = os.path.getsize(self._file("vectors.f32")) // (self._dim * 4)
+            self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(rows, self._dim))
+        if self.name is not None:
+            cache_entries.labels(cache=self.name).set(len(self._index))
+
+    def _read_disk(self, key: str) -> np.ndarray | None:
+        if not self._path:
+            return None
+        with self._disk_lock:
+            try:
+                return self._read_disk_locked(key)
+            except (OSError, ValueError) as e:
+                # e.g. a generation deleted by another process's rotation
+                logger.debug(f"Failed to read embedding cache disk store: {str(e)}")
+                return None
+
+    def _read_disk_locked(self, key: str) -> np.ndarray | None:
+        row = self._index.get(key)
+        if row is None:
+            self._refresh_index()
+            row = self._index.get(key)
+            if row is None:
+                return None
+
+        if self._vectors is None or row >= self._vectors.shape[0]:
+            return None
+        return np.array(self._vectors[row])
+
+    def _append_disk(self, key: str, vector: np.ndarray) -> None:
+        with self._disk_lock:
+            self._append_disk_locked(key, vector)
+
+    def _append_disk_locked(self, key: str, vector: np.ndarray) -> None:
+        # generations come and go, so writers lock a file that is never replaced
+        with open(os.path.join(self._path, "lock"), "ab") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._load_meta()
+                if self._dim is None:
+                    self._dim = int(vector.shape[0])
+                    self._write_meta()
+                if vector.shape[0] != self._dim:
+                    return
+
+                vectors_path = self._file("vectors.f32")
+                size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+                if size // (self._dim * 4) >= self._max_disk_entries:
+                    self._rotate(key)
+                    vectors_path = self._file("vectors.f32")
+                    size = os.path.getsize(vectors_path)
+
+                os.makedirs(os.path.dirname(vectors_path), exist_ok=True)
+                with open(vectors_path, "ab") as f:
+                    f.write(vector.tobytes())
+                with open(self._file("index.tsv"), "ab") as index_file:
+                    index_file.write(f"{key}\t{size // (self._dim * 4)}\n".encode())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self._refresh_index()
+
+    def _rotate(self, key: str) -> None:
+        # runs under the writer lock
+        previous = self._generation
+        self._generation += 1
+        self._index = {}
+        self._index_offset = 0
+        self._vectors = None
+
+        # the new generation starts with this process's recently used embeddings, not cold
+        recent = [(k, v) for k, v in list(self._memory.items()) if k != key and v.shape[0] == self._dim]
+        recent = recent[-(self._max_disk_entries // 2):]
+        os.makedirs(os.path.join(self._path, str(self._generation)), exist_ok=True)
+        with open(self._file("vectors.f32"), "wb") as vectors_file, open(self._file("index.tsv"), "wb") as index_file:
+            for row, (k, v) in enumerate(recent):
+                vectors_file.write(v.tobytes())
+                index_file.write(f"{k}\t{row}\n".encode())
+        self._write_meta()
+
+        # readers may still be on the previous generation; nobody is on the one before it
+        shutil.rmtree(os.path.join(self._path, str(previous - 1)), ignore_errors=True)
+        self.rotations += 1
+        self._count("rotated")
+        logger.info(
+            f"Embedding cache disk store reached {self._max_disk_entries} entries, "
+            f"started generation {self._generation} with {len(recent)} recent entries"
+        )
+
+
+class EmbeddingBatcher:
+    """Sends embedding requests as batched calls.
+
+    The texts of one ``embed_many`` call are sent together as one list input
+    to ``fnc``, up to ``max_batch`` texts per call; each caller receives its
+    own vector. Duplicate texts in a batch are sent once. A failed call fails
+    every caller of that batch.
+
+    By default nothing waits: a lone ``embed`` is sent at once. With
+    ``max_wait`` set, requests arriving within that many seconds of each
+    other on the same event loop are also coalesced. Batches never span event
+    loops, so under the default process executor they never span sessions.
+    """
+
+    def __init__(
+        self,
+        fnc: Callable[[list[str]], Awaitable[list[list[float]]]],
+        *,
+        max_batch: int = 64,
+        max_wait: float = 0.0,
+    ) -> None:
+        self._fnc = fnc
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+
+        # futures cannot be shared across event loops, so pending requests are kept per loop
+        self._pending: dict[asyncio.AbstractEventLoop, list[tuple[str, asyncio.Future]]] = {}
+        self._timers: dict[asyncio.AbstractEventLoop, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.batches = 0
+
+    async def embed(self, text: str) -> list[float]:
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: list[str]) -> list[list[float]]:
+        loop = asyncio.get_running_loop()
+        futs = [loop.create_future() for _ in texts]
+        pending = self._pending.setdefault(loop, [])
+        pending.extend(zip(texts, futs))
+        self.requests += len(texts)
+        if self._max_wait <= 0 or len(pending) >= self._max_batch:
+            self._flush(loop)
+        elif loop not in self._timers:
+            self._timers[loop] = loop.call_later(self._max_wait, self._flush, loop)
+        return list(await asyncio.gather(*futs))
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+        }
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        timer = self._timers.pop(loop, None)
+        if timer is not None:
+            timer.cancel()
+
+        pending = self._pending.pop(loop, [])
+        for start in range(0, len(pending), self._max_batch):
+            self.batches += 1
+            task = asyncio.ensure_future(self._send(pending[start:start + self._max_batch]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            embeddings = await self._fnc(texts)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            vectors = dict(zip(texts, embeddings))
+        except BaseException as e:
+            # every caller hears about it, including when the call is cancelled at shutdown
+            for _, fut in batch:
+                if fut.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    fut.cancel()
+                else:
+                    fut.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        for text, fut in batch:
+            if not fut.done():
+                fut.set_result(vectors[text])
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+
+import numpy as np
+from qdrant_client import models
+from qdrant_client.http.models import QueryResponse
+
+from cache import SingleFlight
+from clients import registry
+
+logger = logging.getLogger(__name__)
+
+_SCROLL_PAGE = 256
+# Seconds before a failed sync is retried, doubling per consecutive failure
+_SYNC_BACKOFF = 5.0
+_SYNC_BACKOFF_MAX = 300.0
+# Indexes up to this many rows are searched on the event loop; a search over larger ones
+# (and the page faults of its first touch of the memory map) runs in a worker thread
+_INLINE_SEARCH_ROWS = 1024
+
+
+class CompanyIndex:
+    """One company's knowledge-base points as a memory-mapped float32 matrix plus payloads.
+
+    Vectors are stored normalized for cosine collections, so a search is one
+    matrix-vector product followed by a partial sort. Use ``asearch`` from the
+    event loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        vectors: np.ndarray,
+        ids: list,
+        payloads: list[dict],
+        hashes: list[str],
+        point_versions: list,
+        version,
+        distance: str,
+        synced_at: float,
+    ) -> None:
+        self.vectors = vectors
+        self.ids = ids
+        self.payloads = payloads
+        self.hashes = hashes
+        self.point_versions = point_versions
+        self.version = version
+        self.distance = distance
+        self.synced_at = synced_at
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    async def asearch(self, embedding, limit: int) -> QueryResponse:
+        """Search without blocking the event loop on large indexes."""
+        if len(self) <= _INLINE_SEARCH_ROWS:
+            return self.search(embedding, limit)
+        return await asyncio.to_thread(self.search, embedding, limit)
+
+    def search(self, embedding, limit: int) -> QueryResponse:
+        if not len(self):
+            return QueryResponse(points=[])
+
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.distance == models.Distance.COSINE:
+            query = query / (np.linalg.norm(query) or 1.0)
+        scores = self.vectors @ query
+
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        return QueryResponse(points=[
+            models.ScoredPoint(id=self.ids[i], version=0, score=float(scores[i]), payload=self.payloads[i])
+            for i in top
+        ])
+
+
+class LocalIndex:
+    """In-process fast path for knowledge-base search of small, hot companies.
+
+    A company's points are synced from Qdrant (filtered by ``companyId``) into a
+    ``CompanyIndex`` kept on disk under ``path``: a float32 vectors file that is
+    memory-mapped, so every job process shares the same pages, and a JSON file
+    with ids, payloads and the knowledge-base version. Syncs run in the
+    background and are incremental: ids, point versions and payloads are
+    listed, and vectors are only retrieved for points that are new or whose
+    point version or payload changed.
+
+    ``get`` only returns an index that matches the requested version; until
+    then callers query Qdrant, which stays the source of truth. Unversioned
+    knowledge bases are re-synced every ``ttl`` seconds. ``get`` never touches
+    the disk: an index written by another process is loaded by the background
+    sync. Failed syncs are retried with exponential backoff.
+    """
+
+    def __init__(self, path: str, *, max_points: int = 10000, ttl: float = 600) -> None:
+        self._path = path
+        self._max_points = max_points
+        self._ttl = ttl
+        self._indexes: dict[tuple[str, str], CompanyIndex] = {}
+        # companies that cannot be served locally, by knowledge-base version
+        self._skipped: dict[tuple[str, str], object] = {}
+        self._flight = SingleFlight()
+        self._failures: dict[tuple[str, str], int] = {}
+        self._retry_at: dict[tuple[str, str], float] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, collection_name: str, company_id: str, version=None) -> CompanyIndex | None:
+        """Return a fresh index for the company, scheduling a background sync otherwise."""
+        key = (collection_name, company_id)
+        index = self._indexes.get(key)
+        if index is not None and self._fresh(index, version):
+            self.hits += 1
+            return index
+
+        self.misses += 1
+        if self._skipped.get(key, ()) != version:
+            self.warm(collection_name, company_id, version)
+        return None
+
+    def warm(self, collection_name: str, company_id: str, version=None) -> None:
+        """Start syncing the company's points in the background, unless a failed sync is backing off."""
+        key = (collection_name, company_id)
+        if time.monotonic() < self._retry_at.get(key, 0.0):
+            return
+        asyncio.ensure_future(self._flight.do(key, lambda: self._sync_with_backoff(key, version)))
+
+    def _fresh(self, index: CompanyIndex, version) -> bool:
+        if version is not None:
+            return index.version == version
+        return time.time() - index.synced_at < self._ttl
+
+    async def _sync_with_backoff(self, key: tuple[str, str], version) -> None:
+        # runs once per coalesced sync, so every waiting lookup sees the same backoff
+        try:
+            await self._sync(key, version)
+        except Exception as e:
+            failures = self._failures.get(key, 0) + 1
+            self._failures[key] = failures
+            delay = min(_SYNC_BACKOFF * 2 ** (failures - 1), _SYNC_BACKOFF_MAX)
+            self._retry_at[key] = time.monotonic() + delay
+            logger.warning(f"Failed to sync local knowledge base index, retrying in {delay:.0f}s: {e}")
+        else:
+            self._failures.pop(key, None)
+            self._retry_at.pop(key, None)
+
+    async def _sync(self, key: tuple[str, str], version) -> None:
+        collection_name, company_id = key
+        previous = self._indexes.get(key)
+        if previous is None:
+            # another process may already have synced it
+            previous = await asyncio.to_thread(self._load, key)
+            if previous is not None:
+                self._indexes[key] = previous
+                if self._fresh(previous, version):
+                    return
+
+        client = registry.qdrant
+
+        info = await client.get_collection(collection_name)
+        params = info.config.params.vectors
+        if not isinstance(params, models.VectorParams) or params.distance not in (models.Distance.COSINE, models.Distance.DOT):
+            logger.info(f"Collection {collection_name} cannot be searched locally, using Qdrant")
+            self._skipped[key] = version
+            return
+
+        company_filter = models.Filter(
+            must=[models.FieldCondition(key="companyId", match=models.MatchValue(value=company_id))]
+        )
+        # query_points without a query pages through points by id and, unlike scroll, returns
+        # each point's version, which Qdrant bumps on every upsert: re-embedded points are
+        # re-fetched even when their payload did not change
+        ids, point_versions, payloads = [], [], []
+        while True:
+            response = await client.query_points(
+                collection_name,
+                query_filter=company_filter,
+                limit=_SCROLL_PAGE,
+                offset=len(ids),
+                with_payload=True,
+                with_vectors=False,
+            )
+            for point in response.points:
+                ids.append(point.id)
+                point_versions.append(point.version)
+                payloads.append(point.payload or {})
+            if len(ids) > self._max_points:
+                logger.info(f"Company {company_id} has over {self._max_points} points, using Qdrant")
+                self._skipped[key] = version
+                return
+            if len(response.points) < _SCROLL_PAGE:
+                break
+
+        hashes = [_payloadHash(payload) for payload in payloads]
+        points = list(zip(ids, point_versions, hashes))
+        known = {}
+        if previous is not None and previous.distance == params.distance:
+            known = {p: row for row, p in enumerate(zip(previous.ids, previous.point_versions, previous.hashes))}
+
+        missing = [p[0] for p in points if p not in known]
+        fetched = {}
+        for start in range(0, len(missing), _SCROLL_PAGE):
+            records = await client.retrieve(
+                collection_name,
+                ids=missing[start:start + _SCROLL_PAGE],
+                with_payload=False,
+                with_vectors=True,
+            )
+            fetched.update((record.id, record.vector) for record in records)
+
+        vectors = np.zeros((len(ids), params.size), dtype=np.float32)
+        for row, p in enumerate(points):
+            if p in known:
+                vectors[row] = previous.vectors[known[p]]
+            else:
+                vectors[row] = fetched[p[0]]
+        if params.distance == models.Distance.COSINE and len(ids):
+            missing_rows = [row for row, p in enumerate(points) if p not in known]
+            norms = np.linalg.norm(vectors[missing_rows], axis=1, keepdims=True)
+            vectors[missing_rows] /= np.where(norms == 0, 1.0, norms)
+
+        index = await asyncio.to_thread(self._write, key, vectors, ids, payloads, hashes, point_versions, version, params.distance)
+        self._indexes[key] = index
+        self._skipped.pop(key, None)
+        logger.info(f"Synced local index for company {company_id}: {len(ids)} points, {len(missing)} fetched")
+
+    def _dir(self, key: tuple[str, str]) -> str:
+        return os.path.join(self._path, hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()[:16])
+
+    def _write(self, key, vectors, ids, payloads, hashes, point_versions, version, distance) -> CompanyIndex:
+        directory = self._dir(key)
+        os.makedirs(directory, exist_ok=True)
+
+        # the vectors file name is unique per sync and only published through meta.json,
+        # so readers in other processes never see a half-written or mismatched pair
+        vectors_name = f"vectors-{os.getpid()}-{time.time_ns()}.f32"
+        vectors.tofile(os.path.join(directory, vectors_name))
+        meta = {
+            "vectors": vectors_name,
+            "dim": vectors.shape[1],
+            "distance": distance,
+            "version": version,
+            "ids": ids,
+            "payloads": payloads,
+            "hashes": hashes,
+            "point_versions": point_versions,
+            "synced_at": time.time(),
+        }
+        tmp = os.path.join(directory, f"meta.json.{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(directory, "meta.json"))
+
+        # open mappings keep unlinked files alive, so older generations can go right away
+        for name in os.listdir(directory):
+            if name.startswith("vectors-") and name != vectors_name:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+        return self._open(directory, meta)
+
+    def _load(self, key: tuple[str, str]) -> CompanyIndex | None:
+        directory = self._dir(key)
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+            index = self._open(directory, meta)
+        except (OSError, ValueError, KeyError):
+            return None
+        return index
+
+    def _open(self, directory: str, meta: dict) -> CompanyIndex:
+        count = len(meta["ids"])
+        if count:
+            vectors = np.memmap(os.path.join(directory, meta["vectors"]), dtype=np.float32, mode="r", shape=(count, meta["dim"]))
+        else:
+            vectors = np.zeros((0, meta["dim"]), dtype=np.float32)
+        return CompanyIndex(
+            vectors=vectors,
+            ids=meta["ids"],
+            payloads=meta["payloads"],
+            hashes=meta["hashes"],
+            # indexes written before point versions were tracked re-fetch every vector once
+            point_versions=meta.get("point_versions") or [None] * count,
+            version=meta["version"],
+            distance=meta["distance"],
+            synced_at=meta["synced_at"],
+        )
+
+
+def _payloadHash(payload: dict) -> str:
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
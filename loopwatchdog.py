@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+
+from metrics import loop_lag, loop_lag_current, loop_stalls
+
+logger = logging.getLogger(__name__)
+
+# Default values for environment variables
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "true").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+# A callback holding the loop longer than this is reported with its stack
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.1"))
+
+
+class LoopWatchdog:
+    """Measures event-loop lag and reports callbacks that block the loop.
+
+    A heartbeat task on the loop wakes every ``interval`` and records how late
+    it was woken in the ``breezeflow_event_loop_lag_seconds`` histogram. A
+    daemon thread checks the heartbeat; when it has not run for longer than
+    ``threshold``, the thread captures the loop thread's current stack (the
+    blocking call itself) and logs it once per stall. Unlike asyncio debug
+    mode, nothing is added to every callback, so it is cheap enough to leave
+    on in production.
+    """
+
+    def __init__(self, *, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_STALL_THRESHOLD) -> None:
+        self._interval = interval
+        self._threshold = threshold
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._beat = time.monotonic()
+        self._reported_beat: float | None = None
+
+        self.lag = 0.0
+        self.smoothed_lag = 0.0
+        self.stalls = 0
+        self.last_stack: str | None = None
+
+    def start(self) -> None:
+        """Watch the running event loop; calling it again on the same loop is a no-op."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+
+        # a reused job process runs each job on a new loop
+        if self._task is not None:
+            self._task.cancel()
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = loop.create_task(self._heartbeat())
+
+        self._stopped.clear()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+        self._task = self._loop = None
+        self.smoothed_lag = 0.0
+        loop_lag_current.set(0.0)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            beat = self._beat
+            start = time.monotonic()
+            await asyncio.sleep(self._interval)
+            self._beat = now = time.monotonic()
+            self.lag = max(0.0, now - start - self._interval)
+            loop_lag.observe(self.lag)
+            self.smoothed_lag = 0.8 * self.smoothed_lag + 0.2 * self.lag
+            loop_lag_current.set(self.smoothed_lag)
+            if self.lag > self._threshold:
+                # the watchdog thread has usually reported this stall with its stack already
+                log = logger.debug if self._reported_beat == beat else logger.warning
+                log(f"Event loop lagged {self.lag * 1000:.0f}ms")
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self._threshold / 2):
+            beat = self._beat
+            if self._loop is None or beat == self._reported_beat:
+                continue
+            if time.monotonic() - beat < self._interval + self._threshold:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._reported_beat = beat
+            self.stalls += 1
+            loop_stalls.inc()
+            self.last_stack = "".join(traceback.format_stack(frame, limit=25))
+            blocked = time.monotonic() - beat - self._interval
+            logger.warning(f"Event loop blocked for over {blocked * 1000:.0f}ms, loop thread stack:\n{self.last_stack}")
+
+
+# One per process; entrypoints call watchdog.start() on their job loop
+watchdog = LoopWatchdog()
@@ -2,6 +2,7 @@ from dotenv import load_dotenv
 
 from livekit import agents
 import json
+import asyncio
 from livekit.agents import ToolError
 from livekit.agents import (
     AgentSession,
@@ -18,10 +19,11 @@ from livekit.plugins import (
     google,
 )
 from openai.types.beta.realtime.session import TurnDetection
-from prompt import getAgentDetails, queryQdrant, getCollectionName
+from prompt import AgentConfig, getAgentConfig, queryQdrant
+from resilience import CircuitOpenError
+from participants import getParticipant
+from clients import registry
 import logging
-from livekit import api
-from livekit.api import RoomParticipantIdentity
 
 
 load_dotenv()
@@ -30,46 +32,50 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Assistant(Agent):
-    def __init__(self, instructions=str) -> None:
+    def __init__(self, instructions=str, agent_config: AgentConfig | None = None) -> None:
+        # Resolved once per session in the entrypoint; the participant and agent never change
+        self._agent_config = agent_config
         super().__init__(instructions=instructions)
     
 
     @function_tool()
     async def lookup_knowledgebase(
+        self,
         context: RunContext,
         query: str,
     ) -> dict:
         """Look information in the knowledge base of the company you're representing. Use this to answer users questions you're not sure about."""
 
-        room = get_job_context().room
-        participant_identity = next(iter(room.remote_participants))
-        async with api.LiveKitAPI() as lkapi:
-            res = await lkapi.room.get_participant(RoomParticipantIdentity(
-                room=room.name,
-                identity=participant_identity,
-            ))
-
-            collection_name, companyId = getCollectionName(res.name)
-
-            if not collection_name:
-                raise ToolError("Knowledge base not found. Please try again later.")
-            response = queryQdrant(query, collection_name, companyId)
-            if not response or not response.points:
-                raise ToolError("No results found in the knowledge base.")
-
-            # Process and format the response
-            results = []
-            for point in response.points:
-                if hasattr(point, 'payload') and point.payload and 'content' in point.payload:
-                    results.append({
-                        'content': point.payload['content'],
-                        'score': point.score
-                    })
-            
-            if not results:
-                raise ToolError("No content found in the knowledge base.")
-
-            return {'results': results}
+        agent_config = self._agent_config
+        if not agent_config or not agent_config.collection_name:
+            raise ToolError("Knowledge base not found. Please try again later.")
+        try:
+            response = await queryQdrant(
+                query,
+                agent_config.collection_name,
+                agent_config.company_id,
+                kb_version=agent_config.kb_version,
+            )
+        except asyncio.TimeoutError:
+            raise ToolError("The knowledge base took too long to respond. Please try again.")
+        except CircuitOpenError:
+            raise ToolError("The knowledge base is temporarily unavailable. Please try again later.")
+        if not response or not response.points:
+            raise ToolError("No results found in the knowledge base.")
+
+        # Process and format the response
+        results = []
+        for point in response.points:
+            if hasattr(point, 'payload') and point.payload and 'content' in point.payload:
+                results.append({
+                    'content': point.payload['content'],
+                    'score': point.score
+                })
+
+        if not results:
+            raise ToolError("No content found in the knowledge base.")
+
+        return {'results': results}
 
 
     # @function_tool()
@@ -110,20 +116,33 @@ class Assistant(Agent):
 async def entrypoint(ctx: agents.JobContext):
     await ctx.connect()
 
+    # share pooled upstream clients with other sessions in this process
+    registry.acquire()
+    ctx.add_shutdown_callback(registry.release)
+
     
     # agent_id = ctx.job
     # logger.info(f"Agent ID: {agent_id}")
     participant = await ctx.wait_for_participant()
     logger.info(f"Starting voice assistant for participant {participant}")
 
-    async with api.LiveKitAPI() as lkapi:
-        res = await lkapi.room.get_participant(RoomParticipantIdentity(
-        room=ctx.job.room.name,
-        identity=participant.identity,
-        ))
+    try:
+        res = await getParticipant(ctx.job.room.name, participant.identity)
         logger.info(f"Participant info: {res.identity}, {res.name}, {res.metadata}")
-
-    systemPrompt = getAgentDetails(participant.name)
+    except Exception as e:
+        logger.warning(f"Failed to look up participant {participant.identity}: {str(e)}")
+
+    try:
+        agent_config = await getAgentConfig(participant.name)
+    except Exception as e:
+        logger.error(f"Failed to retrieve agent details: {str(e)}")
+        agent_config = AgentConfig(
+            agent_id=participant.name,
+            system_prompt=f"Failed to retrieve agent details: {str(e)}",
+            collection_name=None,
+            company_id=None,
+        )
+    systemPrompt = agent_config.system_prompt
     # logger.info(f"System prompt: {systemPrompt}")
     # Initialize the agent session with the Google Gemini model
 
@@ -150,7 +169,7 @@ async def entrypoint(ctx: agents.JobContext):
 
     await session.start(
         room=ctx.room,
-        agent=Assistant(instructions=systemPrompt),
+        agent=Assistant(instructions=systemPrompt, agent_config=agent_config),
         room_input_options=RoomInputOptions(
             noise_cancellation=noise_cancellation.BVC(),
             video_enabled=True,
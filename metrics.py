@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Default values for environment variables
+PROMETHEUS_PORT = int(os.getenv("PROMETHEUS_PORT", "9100"))
+# Job processes write their samples here so the worker can serve all of them from one endpoint
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "/tmp/breezeflow-prometheus")
+
+STAGES = (
+    "agent_config_fetch",
+    "participant_lookup",
+    "embedding",
+    "qdrant_query",
+    "local_index_query",
+    "tool_total",
+    "end_of_turn_to_first_audio",
+    "breezeflow_ttft",
+)
+
+stage_latency = Histogram(
+    "breezeflow_stage_latency_seconds",
+    "Latency of each stage of a voice agent session or turn",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0),
+)
+
+loop_lag = Histogram(
+    "breezeflow_event_loop_lag_seconds",
+    "How late the event loop wakes up a periodic heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+loop_stalls = Counter(
+    "breezeflow_event_loop_stalls_total",
+    "Times a single callback blocked the event loop for longer than the watchdog threshold",
+)
+
+upstream_events = Counter(
+    "breezeflow_upstream_events_total",
+    "Hedged requests, missed deadlines and circuit breaker activity per upstream",
+    ["upstream", "event"],
+)
+
+cache_events = Counter(
+    "breezeflow_cache_events_total",
+    "Hits, misses and invalidations per cache",
+    ["cache", "event"],
+)
+
+# Shared disk stores report the same size from every process, so the largest is kept
+cache_entries = Gauge(
+    "breezeflow_cache_entries",
+    "Entries in a cache's shared disk store",
+    ["cache"],
+    multiprocess_mode="max",
+)
+
+# Per job process ("all" keeps the pid label), read back by the worker's load function
+loop_lag_current = Gauge(
+    "breezeflow_event_loop_lag_current_seconds",
+    "Smoothed event-loop lag of a job process",
+    multiprocess_mode="all",
+)
+
+pending_tool_calls = Gauge(
+    "breezeflow_pending_tool_calls",
+    "Tool calls in flight in a job process",
+    multiprocess_mode="all",
+)
+
+_current_tracer: ContextVar[SessionTracer | None] = ContextVar("breezeflow_session_tracer", default=None)
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record a stage duration in the histogram and in the current session's turn."""
+    stage_latency.labels(stage=stage).observe(seconds)
+    tracer = _current_tracer.get()
+    if tracer is not None:
+        tracer.record(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block as ``stage``, whether it succeeds or raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+class SessionTracer:
+    """Groups the stage timings of one session into turns and logs them.
+
+    ``activate()`` binds the tracer to the current context, so spans recorded
+    by tasks the session spawns (tool calls, LLM streams) land in it. A turn
+    ends when the agent starts speaking after the user stopped; the time in
+    between is recorded as ``end_of_turn_to_first_audio``.
+    """
+
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+        self.turns = 0
+        self._timings: dict[str, float] = {}
+        self._user_stopped_at: float | None = None
+
+    def activate(self) -> None:
+        _current_tracer.set(self)
+
+    def attach(self, session) -> None:
+        session.on("user_state_changed", self._on_user_state_changed)
+        session.on("agent_state_changed", self._on_agent_state_changed)
+
+    def record(self, stage: str, seconds: float) -> None:
+        self._timings[stage] = self._timings.get(stage, 0.0) + seconds
+
+    def end_turn(self) -> None:
+        if self._timings:
+            timings = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self._timings.items())
+            logger.info(f"Session {self.session_id} turn {self.turns} timings: {timings}")
+        self.turns += 1
+        self._timings = {}
+
+    def _on_user_state_changed(self, ev) -> None:
+        if ev.new_state == "speaking":
+            self._user_stopped_at = None
+        elif ev.old_state == "speaking":
+            self._user_stopped_at = time.perf_counter()
+
+    def _on_agent_state_changed(self, ev) -> None:
+        if ev.new_state != "speaking":
+            return
+        if self._user_stopped_at is not None:
+            observe("end_of_turn_to_first_audio", time.perf_counter() - self._user_stopped_at)
+            self._user_stopped_at = None
+        self.end_turn()
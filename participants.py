@@ -0,0 +1,34 @@
+import os
+import logging
+
+from livekit.api import RoomParticipantIdentity
+
+from cache import SingleFlight
+from clients import registry
+from resilience import Upstream
+
+logger = logging.getLogger(__name__)
+
+# Default values for environment variables
+PARTICIPANT_TIMEOUT = float(os.getenv("PARTICIPANT_TIMEOUT", "5"))
+
+_participant_flight = SingleFlight()
+participant_upstream = Upstream("participant", deadline=PARTICIPANT_TIMEOUT)
+
+
+async def getParticipant(room_name, identity):
+    """Look up a participant through the LiveKit server API.
+
+    Concurrent lookups for the same (room, identity) within the room's job process
+    share one request, bounded by ``PARTICIPANT_TIMEOUT`` and hedged when the server
+    is slow. A participant belongs to one room, so there is nothing to share across
+    job processes.
+    """
+
+    async def _fetch():
+        return await participant_upstream.call(lambda: registry.livekit.room.get_participant(RoomParticipantIdentity(
+            room=room_name,
+            identity=identity,
+        )))
+
+    return await _participant_flight.do((room_name, identity), _fetch)
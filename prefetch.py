@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+
+from cache import SemanticCache
+from embeddings import normalizeText
+from prompt import AgentConfig, getEmbedding, queryQdrant
+
+logger = logging.getLogger(__name__)
+
+# Default values for environment variables
+# Cosine similarity above which a tool query is served by a transcript's prefetched results
+PREFETCH_MATCH_THRESHOLD = float(os.getenv("PREFETCH_MATCH_THRESHOLD", "0.85"))
+
+
+class SpeculativePrefetcher:
+    """Runs knowledge-base retrieval on user transcripts before the tool is called.
+
+    Every transcript update (interim or final) cancels the previous pending
+    retrieval and, after a short debounce, starts a new one in the background.
+    A running query for an interim transcript is cancelled as soon as a newer
+    transcript supersedes it; queries for final transcripts are kept.
+    Results are kept per session, keyed by normalized transcript text and by
+    the transcript's embedding. The tool's query is worded by the model and
+    rarely matches the transcript exactly, so ``lookup`` falls back to the
+    most similar transcript above ``threshold``, waiting for its query if it
+    is still running. A cancelled query counts as a miss.
+    """
+
+    def __init__(
+        self,
+        agent_config: AgentConfig,
+        *,
+        debounce: float = 0.15,
+        min_words: int = 3,
+        maxsize: int = 16,
+        threshold: float = PREFETCH_MATCH_THRESHOLD,
+    ) -> None:
+        self._agent_config = agent_config
+        self._debounce = debounce
+        self._min_words = min_words
+        self._maxsize = maxsize
+        self._results: OrderedDict[str, asyncio.Future] = OrderedDict()
+        # transcript embeddings, mapped to their queries' futures
+        self._matches = SemanticCache(threshold=threshold, ttl=float("inf"), maxsize=maxsize, max_keys=1)
+        self._pending: asyncio.Task | None = None
+        self._pending_text: str | None = None
+        # latest interim transcript, whose query is dropped once a newer transcript arrives
+        self._interim_text: str | None = None
+
+        self.started = 0
+        self.cancelled = 0
+        self.hits = 0
+        self.misses = 0
+
+    def on_transcript(self, transcript: str, is_final: bool = False) -> None:
+        text = normalizeText(transcript)
+        if is_final and text == self._interim_text:
+            # confirmed by the final transcript, keep its query
+            self._interim_text = None
+        if text == self._pending_text or text in self._results:
+            return
+        if len(text.split()) < self._min_words or not self._agent_config.collection_name:
+            return
+
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+            self.cancelled += 1
+        self._cancel_interim()
+
+        self._interim_text = None if is_final else text
+        self._pending_text = text
+        self._pending = asyncio.create_task(self._prefetch(text))
+
+    async def lookup(self, query: str):
+        """Return the prefetched response for ``query``, waiting for it if still running."""
+        fut = self._results.get(normalizeText(query))
+        if fut is None and self._results:
+            try:
+                # the tool needs this embedding anyway, so it is cached for its own query
+                fut = self._matches.lookup("transcripts", await getEmbedding(query))
+            except Exception as e:
+                logger.warning(f"Failed to embed tool query for prefetch lookup: {str(e)}")
+        if fut is None or fut.cancelled():
+            self.misses += 1
+            return None
+
+        try:
+            response = await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            if not fut.cancelled():
+                # the tool call itself was cancelled
+                raise
+            self.misses += 1
+            return None
+        except Exception:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return response
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "started": self.started,
+            "cancelled": self.cancelled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    async def aclose(self) -> None:
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+        for fut in self._results.values():
+            fut.cancel()
+        self._results.clear()
+        self._matches.invalidate()
+        logger.info(f"Speculative prefetch stats: {self.stats()}")
+
+    def _cancel_interim(self) -> None:
+        if self._interim_text is None:
+            return
+        fut = self._results.get(self._interim_text)
+        if fut is not None and not fut.done():
+            fut.cancel()
+            del self._results[self._interim_text]
+            self.cancelled += 1
+        self._interim_text = None
+
+    async def _prefetch(self, text: str) -> None:
+        await asyncio.sleep(self._debounce)
+
+        self.started += 1
+        fut = asyncio.ensure_future(self._query(text))
+        # failures surface as a miss when the tool looks the text up
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._results[text] = fut
+        while len(self._results) > self._maxsize:
+            _, evicted = self._results.popitem(last=False)
+            evicted.cancel()
+
+    async def _query(self, text: str):
+        # queryQdrant finds this embedding in the embedding cache
+        embedding = await getEmbedding(text)
+        self._matches.store("transcripts", embedding, asyncio.current_task())
+        return await queryQdrant(
+            text,
+            self._agent_config.collection_name,
+            self._agent_config.company_id,
+            kb_version=self._agent_config.kb_version,
+        )
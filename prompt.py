@@ -1,9 +1,19 @@
 import requests
+import asyncio
 import logging
-from openai import AzureOpenAI
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
+from qdrant_client.models import Filter, FieldCondition, MatchValue, QueryRequest
+
+from cache import SemanticCache, SharedFileCache, SingleFlight, TTLCache
+from clients import registry
+from embeddings import EmbeddingBatcher, EmbeddingCache
+from localindex import LocalIndex
+from metrics import span
+from retrieval import expandQuery, fuseResults
+from resilience import Upstream
 
 
 import os
@@ -12,16 +22,37 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 # Default values for environment variables
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")
-
-client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-
-azure_client = AzureOpenAI(
-    api_key = os.getenv("AZURE_OPENAI_API_KEY", "your-api-key-here"),
-    api_version = "2024-10-21",
-    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "https://breezeopenai.openai.azure.com/")
-)
+AGENT_CONFIG_TTL = float(os.getenv("AGENT_CONFIG_TTL", "300"))
+AGENT_CONFIG_CACHE_SIZE = int(os.getenv("AGENT_CONFIG_CACHE_SIZE", "256"))
+# Agent documents fetched by one job process are shared with the others on the host through this directory
+AGENT_CONFIG_CACHE_DIR = os.getenv("AGENT_CONFIG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "breezeflow", "agents"))
+# How long the last good config is served when the agent API is failing
+AGENT_CONFIG_STALE_TTL = float(os.getenv("AGENT_CONFIG_STALE_TTL", "86400"))
+AGENT_API_TIMEOUT = float(os.getenv("AGENT_API_TIMEOUT", "10"))
+# Total time prewarm spends preloading agent configs; keep it under livekit's initialize_process_timeout (10s)
+AGENT_PRELOAD_TIMEOUT = float(os.getenv("AGENT_PRELOAD_TIMEOUT", "5"))
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "breezeflow", "embeddings"))
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "5000"))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "5"))
+# Query variants are embedded in one Azure call; above 0, requests from the same job process
+# arriving within this window are coalesced too, at the cost of delaying every cold lookup
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "0"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+QDRANT_TIMEOUT = float(os.getenv("QDRANT_TIMEOUT", "5"))
+# "single" searches the raw query; "expanded" also searches keyword-only and last-turn variants and fuses them
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "single").lower()
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "5"))
+RETRIEVAL_LIMIT = int(os.getenv("RETRIEVAL_LIMIT", "3"))
+# Serve small knowledge bases from an in-process copy, falling back to Qdrant
+LOCAL_INDEX = os.getenv("LOCAL_INDEX", "false").lower() == "true"
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "breezeflow", "index"))
+LOCAL_INDEX_MAX_POINTS = int(os.getenv("LOCAL_INDEX_MAX_POINTS", "10000"))
+LOCAL_INDEX_TTL = float(os.getenv("LOCAL_INDEX_TTL", "600"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "128"))
 
 systemPromptTemplate="""
 You are an AI support guide for {company_name}. Your job is to warmly assist visitors with questions about the company, and to learn about their role, business, or goals so you can explain how the product helps them specifically.
@@ -78,31 +109,174 @@ Great! You can book a demo <a href="https://doodle.com/bp/nikbedi/breezeflow-dem
 
 
 
-def getAgentDetails(agent_id):
+@dataclass(frozen=True)
+class AgentConfig:
+    agent_id: str
+    system_prompt: str
+    collection_name: str | None
+    company_id: str | None
+    # changes whenever the knowledge base is re-indexed
+    kb_version: str | None = None
+
+
+# Agent documents rarely change. Parsed configs are cached per job process; the documents
+# themselves are shared by the host's job processes, so concurrent rooms of one agent make
+# one request between them
+_agent_configs = TTLCache(maxsize=AGENT_CONFIG_CACHE_SIZE, ttl=AGENT_CONFIG_TTL)
+_agent_documents = SharedFileCache(AGENT_CONFIG_CACHE_DIR, ttl=AGENT_CONFIG_TTL) if AGENT_CONFIG_CACHE_DIR else None
+_stale_agent_configs = TTLCache(maxsize=AGENT_CONFIG_CACHE_SIZE, ttl=AGENT_CONFIG_STALE_TTL)
+_agent_config_flight = SingleFlight()
+agent_config_upstream = Upstream("agent_config", deadline=AGENT_API_TIMEOUT)
+
+
+def _agentUrl(agent_id):
     is_staging = os.getenv("IS_STAGING", "false")
     url = f"https://app.breezeflow.ai/api/v1/agent?id={agent_id}"
 
     # Check if the environment is staging
     if is_staging.lower() == "true":
         url = f"https://staging.breezeflow.io/api/v1/agent?id={agent_id}"
-    headers = {"Authorization": "Bearer " + os.getenv("BREEZE_API_KEY", "yto1ad8ckbk87xjunxrq7mqdpbv4id")}
+
+    # Explicit override, e.g. a local stand-in used by the benchmarks
+    base_url = os.getenv("BREEZE_API_URL")
+    if base_url:
+        url = f"{base_url.rstrip('/')}/api/v1/agent?id={agent_id}"
+    return url
+
+
+def _agentHeaders():
+    return {"Authorization": "Bearer " + os.getenv("BREEZE_API_KEY", "yto1ad8ckbk87xjunxrq7mqdpbv4id")}
+
+
+def _parseAgentConfig(agent_id, data):
+    if "data" not in data:
+        raise ValueError("Invalid response format")
+
+    agent_data = data["data"]
+    company_info = f"{agent_data.get('description', 'No description provided')} — Your name: {agent_data.get('name', 'Unknown')}, Tone: {agent_data.get('tone', 'Not specified')}"
+    company = agent_data.get("company") or {}
+    company_name = company.get("company_name", "Unknown")
+    system_prompt = systemPromptTemplate.format(company_info=company_info, company_name=company_name)
+
+    collection_name = None
+    kb_version = None
+    knowledge_base = agent_data.get("KnowledgeBase")
+    if knowledge_base and len(knowledge_base) > 0:
+        collection_name = knowledge_base[0].get("collectionName")
+        kb_version = knowledge_base[0].get("updatedAt") or knowledge_base[0].get("version")
+
+    return AgentConfig(
+        agent_id=agent_id,
+        system_prompt=system_prompt,
+        collection_name=collection_name,
+        company_id=company.get("_id", "Unknown"),
+        kb_version=str(kb_version) if kb_version is not None else None,
+    )
+
+
+async def getAgentConfig(agent_id):
+    """Fetch the agent document once and return its prompt, collection name and companyId.
+
+    Results are cached per agent id for ``AGENT_CONFIG_TTL`` seconds; failures are not cached.
+    Concurrent misses for the same agent id share a single request, within this process
+    and, through ``AGENT_CONFIG_CACHE_DIR``, across the job processes of the host. When the
+    agent API fails or its circuit is open, the last good config is served for up to
+    ``AGENT_CONFIG_STALE_TTL`` seconds.
+    """
+    config = _agent_configs.get(agent_id)
+    if config is not None:
+        return config
+
+    async def _request():
+        async with registry.http.get(
+            _agentUrl(agent_id),
+            headers=_agentHeaders(),
+            timeout=aiohttp.ClientTimeout(total=AGENT_API_TIMEOUT),
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def _fetch():
+        try:
+            if _agent_documents is not None:
+                data = await _agent_documents.do(agent_id, lambda: agent_config_upstream.call(_request))
+            else:
+                data = await agent_config_upstream.call(_request)
+        except Exception as e:
+            stale = _stale_agent_configs.get(agent_id)
+            if stale is None:
+                raise
+            logger.warning(f"Serving last known config for agent {agent_id}: {str(e)}")
+            return stale
+
+        config = _parseAgentConfig(agent_id, data)
+        previous = _stale_agent_configs.get(agent_id)
+        if previous is not None and previous.collection_name and previous.kb_version != config.kb_version:
+            # re-indexing shows up as a new knowledge-base version in the agent document
+            logger.info(f"Knowledge base of agent {agent_id} changed, dropping cached results")
+            invalidateKnowledgebase(previous.collection_name, previous.company_id)
+        _agent_configs.set(agent_id, config)
+        _stale_agent_configs.set(agent_id, config)
+        return config
+
+    return await _agent_config_flight.do(agent_id, _fetch)
+
+
+def preloadAgentConfigs(agent_ids, timeout=AGENT_PRELOAD_TIMEOUT):
+    """Fetch and cache agent configs concurrently, e.g. from a process prewarm hook.
+
+    Blocks for at most ``timeout`` seconds in total; agents that have not answered
+    by then are skipped and fetched on their first session instead.
+    """
+    if not agent_ids:
+        return {}
+
+    def _fetch(agent_id):
+        data = _agent_documents.get(agent_id) if _agent_documents is not None else None
+        if data is None:
+            response = requests.get(_agentUrl(agent_id), headers=_agentHeaders(), timeout=min(AGENT_API_TIMEOUT, timeout))
+            response.raise_for_status()
+            data = response.json()
+            if _agent_documents is not None:
+                _agent_documents.set(agent_id, data)
+        return _parseAgentConfig(agent_id, data)
+
+    executor = ThreadPoolExecutor(max_workers=min(len(agent_ids), 8), thread_name_prefix="agent-preload")
+    futures = {executor.submit(_fetch, agent_id): agent_id for agent_id in agent_ids}
+    done, not_done = wait(futures, timeout=timeout)
+    # don't wait for stragglers, their requests are bounded by the same timeout
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    configs = {}
+    for fut in done:
+        agent_id = futures[fut]
+        try:
+            configs[agent_id] = fut.result()
+        except Exception as e:
+            logger.warning(f"Failed to preload agent {agent_id}: {str(e)}")
+            continue
+        _agent_configs.set(agent_id, configs[agent_id])
+        _stale_agent_configs.set(agent_id, configs[agent_id])
+    for fut in not_done:
+        logger.warning(f"Preloading agent {futures[fut]} timed out after {timeout}s")
+    return configs
+
+
+async def warmConnections():
+    """Open pooled connections to the agent API and LiveKit server before they are needed."""
+    await registry.warm([_agentUrl("")])
+
+
+def _getAgentSync(agent_id):
+    response = requests.get(_agentUrl(agent_id), headers=_agentHeaders(), timeout=AGENT_API_TIMEOUT)
+    response.raise_for_status()
+    return response
+
+
+def getAgentDetails(agent_id):
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-        if "data" in data:
-            agent_data = data["data"]
-            # company_info = f"{agent_data.get('description', 'No description provided')} — Your name: {agent_data.get('name', 'Unknown')}, Tone: {agent_data.get('tone', 'Not specified')}"
-            company_info = f"{agent_data.get('description', 'No description provided')} — Your name: {agent_data.get('name', 'Unknown')}, Tone: {agent_data.get('tone', 'Not specified')}"
-            company = agent_data.get("company", "Unknown")
-            company_name = company.get("company_name", "Unknown")
-            
-            system_prompt = systemPromptTemplate.format(company_info=company_info, company_name=company_name)
-#            logger.info(f"getAgentDetails called with user_name={user_name}, returns prompt: {prompt}")
-            return system_prompt
-        else:
-            raise ValueError("Invalid response format")
+        response = agent_config_upstream.call_sync(lambda: _getAgentSync(agent_id))
+        return _parseAgentConfig(agent_id, response.json()).system_prompt
     except Exception as e:
         return f"Failed to retrieve agent details: {str(e)}"
 
@@ -112,51 +286,172 @@ def getAgentDetails(agent_id):
 
 
 def getCollectionName(agent_id):
-    is_staging = os.getenv("IS_STAGING", "false")
-    url = f"https://app.breezeflow.ai/api/v1/agent?id={agent_id}"
-
-    # Check if the environment is staging
-    if is_staging.lower() == "true":
-        url = f"https://staging.breezeflow.io/api/v1/agent?id={agent_id}"
-    headers = {"Authorization": "Bearer " + os.getenv("BREEZE_API_KEY", "yto1ad8ckbk87xjunxrq7mqdpbv4id")}
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-        if "data" in data and "KnowledgeBase" in data["data"]:
-            agent_data = data["data"]
-            company = agent_data.get("company", "Unknown")
-            companyId = company.get("_id", "Unknown")
-            knowledge_base = data["data"]["KnowledgeBase"]
-            
-            if knowledge_base and len(knowledge_base) > 0:
-                return knowledge_base[0].get("collectionName"), companyId
+        response = agent_config_upstream.call_sync(lambda: _getAgentSync(agent_id))
+        config = _parseAgentConfig(agent_id, response.json())
+
+        if config.collection_name:
+            return config.collection_name, config.company_id
         return None
     except Exception as e:
         logger.error(f"Failed to retrieve collection name: {str(e)}")
         return None
 
 
-def getEmbedding(text):
-    response = azure_client.embeddings.create(
-        input = text,
-        model= "text-embedding-3-large"
-    )
-    # Extract the embedding vector from the response
-    return response.data[0].embedding
+embedding_cache = EmbeddingCache(
+    maxsize=EMBEDDING_CACHE_SIZE,
+    path=os.path.join(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL) if EMBEDDING_CACHE_DIR else None,
+    max_disk_entries=EMBEDDING_CACHE_DISK_SIZE,
+    name="embedding",
+)
+_embedding_flight = SingleFlight()
+_qdrant_flight = SingleFlight()
+# Per job process, so with the default executor it serves repeated questions within one session
+semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl=SEMANTIC_CACHE_TTL,
+    maxsize=SEMANTIC_CACHE_SIZE,
+    name="semantic",
+)
+# batched embeddings are not hedged: a second batch would double the Azure rate-limit cost
+embedding_upstream = Upstream("embedding", deadline=EMBEDDING_TIMEOUT, hedge=False)
+qdrant_upstream = Upstream("qdrant", deadline=QDRANT_TIMEOUT)
+local_index = LocalIndex(LOCAL_INDEX_DIR, max_points=LOCAL_INDEX_MAX_POINTS, ttl=LOCAL_INDEX_TTL) if LOCAL_INDEX else None
+
+
+async def _embedBatch(texts):
+    with span("embedding"):
+        response = await embedding_upstream.call(
+            lambda: registry.azure.embeddings.create(
+                input = texts,
+                model= EMBEDDING_MODEL
+            ),
+        )
+    # Extract the embedding vectors from the response, in input order
+    return [data.embedding for data in sorted(response.data, key=lambda data: data.index)]
+
+
+embedding_batcher = EmbeddingBatcher(
+    _embedBatch,
+    max_batch=EMBEDDING_BATCH_SIZE,
+    max_wait=EMBEDDING_BATCH_WAIT_MS / 1000,
+)
 
 
-def queryQdrant(query, collection_name, companyId):
-    logger.info(f"Querying Qdrant with collection name: {collection_name} - companyId: {companyId}")
-    query_embedding = getEmbedding(query)
-    response = client.query_points(
-        collection_name=collection_name,
-        query=query_embedding,
-        limit=2,
-        with_payload=True,
-        query_filter=Filter(
+async def getEmbedding(text):
+    cached = await embedding_cache.aget(text)
+    if cached is not None:
+        return cached.tolist()
+
+    async def _embed():
+        embedding = await embedding_batcher.embed(text)
+        embedding_cache.put_nowait(text, embedding)
+        return embedding
+
+    return await _embedding_flight.do(EmbeddingCache.key(text), _embed)
+
+
+async def getEmbeddings(texts):
+    """Embed several texts, fetching all of those not cached yet in one request."""
+    vectors = [await embedding_cache.aget(text) for text in texts]
+    missing = [text for text, vector in zip(texts, vectors) if vector is None]
+
+    if missing:
+        async def _embed():
+            embeddings = await embedding_batcher.embed_many(missing)
+            for text, embedding in zip(missing, embeddings):
+                embedding_cache.put_nowait(text, embedding)
+            return embeddings
+
+        # a concurrent caller sharing this flight may have sent differently written texts
+        # with the same normalized keys, so results are matched by key, not by raw text
+        keys = tuple(EmbeddingCache.key(text) for text in missing)
+        fetched = dict(zip(keys, await _embedding_flight.do(keys, _embed)))
+        return [fetched[EmbeddingCache.key(text)] if vector is None else vector.tolist() for text, vector in zip(texts, vectors)]
+
+    return [vector.tolist() for vector in vectors]
+
+
+def invalidateKnowledgebase(collection_name, companyId):
+    """Forget cached search results after a company's knowledge base is re-indexed."""
+    semantic_cache.invalidate((collection_name, companyId))
+
+
+def warmKnowledgebase(collection_name, companyId, kb_version=None):
+    """Start syncing the company's local index, if enabled, ahead of the first lookup."""
+    if local_index and collection_name:
+        local_index.warm(collection_name, companyId, kb_version)
+
+
+async def _searchQdrant(collection_name, companyId, embeddings):
+    company_filter = Filter(
         must=[FieldCondition(key="companyId", match=MatchValue(value=companyId))]
-    ),
     )
-    return response
+    with span("qdrant_query"):
+        if len(embeddings) == 1:
+            return await qdrant_upstream.call(
+                lambda: registry.qdrant.query_points(
+                    collection_name=collection_name,
+                    query=embeddings[0],
+                    limit=2,
+                    with_payload=True,
+                    query_filter=company_filter,
+                ),
+            )
+
+        # every variant in one round trip, fused into a single ranking
+        responses = await qdrant_upstream.call(
+            lambda: registry.qdrant.query_batch_points(
+                collection_name=collection_name,
+                requests=[
+                    QueryRequest(query=embedding, filter=company_filter, limit=RETRIEVAL_CANDIDATES, with_payload=True)
+                    for embedding in embeddings
+                ],
+            ),
+        )
+    return fuseResults(responses, RETRIEVAL_LIMIT)
+
+
+async def queryQdrant(query, collection_name, companyId, kb_version=None, last_turn=None):
+    """Search the company's knowledge base.
+
+    When Qdrant fails, misses its deadline or its circuit is open, the closest
+    cached result is served even if it has expired; otherwise the error is raised.
+    """
+    logger.info(f"Querying Qdrant with collection name: {collection_name} - companyId: {companyId}")
+    variants = expandQuery(query, last_turn) if RETRIEVAL_MODE == "expanded" else [query]
+
+    async def _query():
+        if len(variants) == 1:
+            embeddings = [await getEmbedding(query)]
+        else:
+            embeddings = await getEmbeddings(variants)
+        query_embedding = embeddings[0]
+        cached = semantic_cache.lookup((collection_name, companyId), query_embedding, version=kb_version)
+        if cached is not None:
+            logger.info("Serving knowledge base results from semantic cache")
+            return cached
+
+        index = local_index.get(collection_name, companyId, kb_version) if local_index else None
+        if index is not None:
+            with span("local_index_query"):
+                if len(embeddings) == 1:
+                    return await index.asearch(query_embedding, limit=2)
+                responses = await asyncio.gather(*(index.asearch(e, limit=RETRIEVAL_CANDIDATES) for e in embeddings))
+                return fuseResults(responses, RETRIEVAL_LIMIT)
+
+        try:
+            response = await _searchQdrant(collection_name, companyId, embeddings)
+        except Exception as e:
+            stale = semantic_cache.lookup((collection_name, companyId), query_embedding, version=kb_version, allow_expired=True)
+            if stale is None:
+                raise
+            logger.warning(f"Serving expired knowledge base results: {str(e)}")
+            return stale
+
+        if response.points:
+            semantic_cache.store((collection_name, companyId), query_embedding, response, version=kb_version)
+        return response
+
+    key = (collection_name, companyId) + tuple(EmbeddingCache.key(variant) for variant in variants)
+    return await _qdrant_flight.do(key, _query)
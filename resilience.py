@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+import httpx
+import numpy as np
+import openai
+from qdrant_client.http.exceptions import ResponseHandlingException
+
+from metrics import upstream_events
+
+logger = logging.getLogger(__name__)
+
+# Default values for environment variables
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "5"))
+UPSTREAM_RESET_TIMEOUT = float(os.getenv("UPSTREAM_RESET_TIMEOUT", "10"))
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "true").lower() == "true"
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+
+# Successful calls needed before the hedge delay is derived from their p95
+_MIN_HEDGE_SAMPLES = 20
+
+# Transport errors of the HTTP clients that do not derive from OSError
+_CONNECTION_ERRORS = (
+    aiohttp.ClientConnectionError,
+    httpx.TransportError,
+    openai.APIConnectionError,
+    ResponseHandlingException,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+def _isUpstreamFailure(e: BaseException) -> bool:
+    """Whether an error means the upstream is unhealthy: a timeout, a connection error or a 5xx.
+
+    Other errors, such as a 400 or 404 for one request, say nothing about the
+    upstream and do not count towards opening its circuit.
+    """
+    # aiohttp and livekit errors carry ``status``, openai and qdrant ones ``status_code``,
+    # requests' HTTPError its response
+    status = getattr(e, "status_code", None) or getattr(e, "status", None)
+    if status is None and getattr(e, "response", None) is not None:
+        status = getattr(e.response, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    # OSError covers builtin connection errors, timeouts and requests' transport errors
+    return isinstance(e, (asyncio.TimeoutError, OSError) + _CONNECTION_ERRORS)
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after consecutive failures.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    fail immediately. Once ``reset_timeout`` seconds have passed, a single
+    probe call is let through (half-open); its outcome closes or re-opens the
+    circuit. Only errors that mean the upstream is unhealthy count as failures;
+    any other answer counts as a success.
+    """
+
+    def __init__(self, name: str, *, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self._opened_at >= self._reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probing or (self._opened_at is None and self._failures >= self._failure_threshold):
+            if self._opened_at is None:
+                logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+                upstream_events.labels(upstream=self.name, event="circuit_open").inc()
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+
+class Upstream:
+    """Deadline, hedging and circuit breaking for calls to one upstream stage.
+
+    ``call`` bounds the whole call, hedge included, by ``deadline``. If the
+    first attempt has not answered within the p95 of recent successful calls,
+    an identical second attempt is started and the first answer wins. Calls
+    are only hedged once enough latencies have been observed, and only for
+    idempotent reads (``hedge=True``).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        deadline: float,
+        hedge: bool = HEDGE_REQUESTS,
+        hedge_min_delay: float = HEDGE_MIN_DELAY_MS / 1000,
+        failure_threshold: int = UPSTREAM_FAILURE_THRESHOLD,
+        reset_timeout: float = UPSTREAM_RESET_TIMEOUT,
+        window: int = 200,
+    ) -> None:
+        self.name = name
+        self._deadline = deadline
+        self._hedge = hedge
+        self._hedge_min_delay = hedge_min_delay
+        self._latencies: deque[float] = deque(maxlen=window)
+        self.breaker = CircuitBreaker(name, failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+
+    def hedge_delay(self) -> float | None:
+        if not self._hedge or len(self._latencies) < _MIN_HEDGE_SAMPLES:
+            return None
+        delay = max(float(np.percentile(self._latencies, 95)), self._hedge_min_delay)
+        return delay if delay < self._deadline else None
+
+    async def call(self, fnc: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.breaker.allow():
+            upstream_events.labels(upstream=self.name, event="rejected").inc()
+            raise CircuitOpenError(f"{self.name} is unavailable")
+
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self._hedged(fnc), timeout=self._deadline)
+        except asyncio.CancelledError:
+            self.breaker._probing = False
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                upstream_events.labels(upstream=self.name, event="deadline_exceeded").inc()
+            self._record_error(e)
+            raise
+
+        self._latencies.append(time.monotonic() - start)
+        self.breaker.record_success()
+        return result
+
+    def call_sync(self, fnc: Callable[[], Any]) -> Any:
+        """Circuit breaking for blocking calls; ``fnc`` must enforce the deadline itself."""
+        if not self.breaker.allow():
+            upstream_events.labels(upstream=self.name, event="rejected").inc()
+            raise CircuitOpenError(f"{self.name} is unavailable")
+        try:
+            result = fnc()
+        except Exception as e:
+            self._record_error(e)
+            raise
+        self.breaker.record_success()
+        return result
+
+    def _record_error(self, e: Exception) -> None:
+        if _isUpstreamFailure(e):
+            self.breaker.record_failure()
+        else:
+            # the upstream answered, only this request was rejected
+            self.breaker.record_success()
+
+    async def _hedged(self, fnc: Callable[[], Awaitable[Any]]) -> Any:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await fnc()
+
+        attempts = {asyncio.ensure_future(fnc())}
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done:
+                upstream_events.labels(upstream=self.name, event="hedged").inc()
+                attempts.add(asyncio.ensure_future(fnc()))
+
+            error: BaseException | None = None
+            pending = attempts
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+                    error = attempt.exception()
+            raise error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
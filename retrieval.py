@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import re
+
+from qdrant_client.http.models import QueryResponse
+
+from embeddings import normalizeText
+
+# Reciprocal-rank fusion constant; larger values flatten the weight of top ranks
+RRF_K = 60
+
+_STOPWORDS = frozenset("""
+a about an and any are as at be can could do does did for from have has how i if in is it its
+me my of on or our please should so tell that the their there these this to us was we what
+when where which who why will with would you your yours know want like just really
+um uh hey hi okay ok
+""".split())
+
+
+def keywordQuery(text):
+    """Drop filler and stop words from a spoken query, keeping its content words."""
+    words = [word for word in re.findall(r"[\w']+", text.lower()) if word not in _STOPWORDS]
+    return " ".join(words)
+
+
+def expandQuery(query, last_turn=None):
+    """Return the retrieval variants of a query: original, keyword-only and contextualized with the last turn."""
+    variants = [query]
+    keywords = keywordQuery(query)
+    if keywords:
+        variants.append(keywords)
+    if last_turn and normalizeText(last_turn) != normalizeText(query):
+        variants.append(f"{last_turn} {query}")
+
+    unique = []
+    seen = set()
+    for variant in variants:
+        key = normalizeText(variant)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(variant)
+    return unique
+
+
+def fuseResults(responses, limit, k=RRF_K):
+    """Merge ranked responses with reciprocal-rank fusion, dropping duplicate chunks.
+
+    Points are ordered by fused score; each keeps its best similarity score so
+    the model still sees how close the match is.
+    """
+    fused = {}
+    for response in responses:
+        for rank, point in enumerate(response.points):
+            entry = fused.get(point.id)
+            if entry is None:
+                fused[point.id] = [1.0 / (k + rank + 1), point]
+            else:
+                entry[0] += 1.0 / (k + rank + 1)
+                if point.score > entry[1].score:
+                    entry[1] = point
+
+    points = []
+    seen_content = set()
+    for _, point in sorted(fused.values(), key=lambda entry: entry[0], reverse=True):
+        # the same chunk is sometimes indexed more than once under different ids
+        content = normalizeText((point.payload or {}).get("content", "")) or point.id
+        if content in seen_content:
+            continue
+        seen_content.add(content)
+        points.append(point)
+        if len(points) == limit:
+            break
+    return QueryResponse(points=points)
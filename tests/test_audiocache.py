@@ -0,0 +1,57 @@
+import asyncio
+import logging
+
+import numpy as np
+from livekit import rtc
+
+from audiocache import AudioClipCache
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def tone(seconds, sample_rate=24000):
+    samples = (np.sin(np.arange(int(seconds * sample_rate)) / 10) * 8000).astype(np.int16)
+    return rtc.AudioFrame(samples.tobytes(), sample_rate, 1, len(samples))
+
+
+def test_clip_synthesized_once_and_reloaded_from_disk(tmp_path):
+    """Concurrent loads share one synthesis; a new cache on the same path reads the clip from disk"""
+    calls = []
+
+    async def synthesize(text, voice):
+        calls.append((text, voice))
+        await asyncio.sleep(0.01)
+        return tone(0.5)
+
+    async def run():
+        cache = AudioClipCache(str(tmp_path), synthesize=synthesize)
+        assert cache.get("Let me check that for you.", voice="alloy") is None
+        clips = await asyncio.gather(*[cache.load("Let me check that for you.", voice="alloy") for _ in range(5)])
+        assert len(calls) == 1
+        assert cache.get("Let me check that for you.", voice="alloy") is clips[0]
+
+        frames = [frame async for frame in clips[0].frames()]
+        assert len(frames) == 25
+        assert sum(frame.samples_per_channel for frame in frames) == 12000
+
+        reloaded = AudioClipCache(str(tmp_path), synthesize=synthesize)
+        clip = await reloaded.load("Let me check that for you.", voice="alloy")
+        assert len(calls) == 1
+        assert clip.pcm == clips[0].pcm
+        assert clip.sample_rate == 24000
+
+        # another voice or scope is another clip
+        await reloaded.load("Let me check that for you.", voice="echo")
+        await reloaded.load("Let me check that for you.", voice="alloy", scope="agent-1")
+        assert len(calls) == 3
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as path:
+        test_clip_synthesized_once_and_reloaded_from_disk(path)
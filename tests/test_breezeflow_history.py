@@ -0,0 +1,62 @@
+import logging
+
+from livekit.agents import llm
+
+from breezeflowLLm import _compact_history, _serialize_messages
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def make_history(turns: int) -> list[dict]:
+    messages = [{"id": "sys", "text": "You are a helpful guide.", "role": "system"}]
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"id": f"msg-{i}", "text": f"Turn {i}. " + "word " * 40, "role": role})
+    return messages
+
+
+def test_serialize_stable_ids_without_images():
+    """Messages keep their chat context ids and image content is dropped"""
+    chat_ctx = llm.ChatContext.empty()
+    chat_ctx.add_message(role="system", content="Be brief.")
+    chat_ctx.add_message(role="user", content=["What is this?", llm.ImageContent(image="data:image/jpeg;base64,AAAA")])
+    chat_ctx.add_message(role="user", content=[llm.ImageContent(image="data:image/jpeg;base64,AAAA")])
+
+    first = _serialize_messages(chat_ctx)
+    assert first == _serialize_messages(chat_ctx)
+    assert [m["text"] for m in first] == ["Be brief.", "What is this?"]
+    assert first[1]["id"] == chat_ctx.items[1].id
+
+
+def test_compaction_keeps_system_and_recent_turns():
+    """Older turns are dropped to fit the budget; system and latest messages are kept"""
+    messages = make_history(20)
+    compacted = _compact_history(messages, 200, summarize=False)
+
+    assert compacted[0]["id"] == "sys"
+    assert compacted[-1]["id"] == "msg-19"
+    assert 2 < len(compacted) < len(messages)
+    assert [m["id"] for m in compacted[1:]] == [m["id"] for m in messages[-(len(compacted) - 1):]]
+
+    assert _compact_history(messages, None, summarize=False) == messages
+    # a single oversized message is still sent
+    assert _compact_history(messages, 1, summarize=False)[-1]["id"] == "msg-19"
+
+
+def test_compaction_summarizes_dropped_turns():
+    """Dropped turns are replaced by a stable extractive summary"""
+    messages = make_history(20)
+    compacted = _compact_history(messages, 300, summarize=True)
+    summary = compacted[1]
+
+    assert summary["role"] == "system"
+    assert summary["text"].startswith("Summary of earlier conversation:")
+    assert compacted == _compact_history(messages, 300, summarize=True)
+
+
+if __name__ == "__main__":
+    test_serialize_stable_ids_without_images()
+    test_compaction_keeps_system_and_recent_turns()
+    test_compaction_summarizes_dropped_turns()
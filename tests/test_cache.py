@@ -0,0 +1,222 @@
+import time
+import asyncio
+import threading
+import logging
+
+import numpy as np
+from prometheus_client import REGISTRY
+
+from cache import SemanticCache, SharedFileCache, SingleFlight, TTLCache
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def test_ttl_cache_expiry():
+    """Entries are dropped once their TTL has elapsed"""
+    cache = TTLCache(maxsize=4, ttl=0.05)
+    cache.set("agent", "config")
+    assert cache.get("agent") == "config"
+
+    time.sleep(0.06)
+    assert cache.get("agent") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_lru_eviction():
+    """The least recently used entry is evicted when the cache is full"""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_single_flight_coalesces():
+    """Concurrent calls for the same key share one upstream call"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "config"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("agent", fetch) for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert results == ["config"] * 10
+    assert calls == 1
+    assert len(flight) == 0
+
+
+def test_single_flight_cancelled_waiter():
+    """Cancelling one waiter does not cancel the shared call"""
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "config"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("agent", fetch))
+        second = asyncio.ensure_future(flight.do("agent", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "config"
+
+
+def test_single_flight_abandoned_call_cancelled():
+    """The shared call is cancelled once every waiter has been cancelled"""
+    flight = SingleFlight()
+    cancelled = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        waiters = [asyncio.ensure_future(flight.do("query", fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled == [True]
+    assert len(flight) == 0
+
+
+def test_single_flight_per_event_loop():
+    """Jobs on separate event loops (thread executor) each get their own call instead of a foreign future"""
+    flight = SingleFlight()
+    calls = 0
+    results = []
+    errors = []
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "config"
+
+    def job():
+        try:
+            results.append(asyncio.run(flight.do("agent", fetch)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=job) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert errors == []
+    assert results == ["config", "config"]
+    assert calls == 2
+    assert len(flight) == 0
+
+
+def test_shared_file_cache_one_call_per_host(tmp_path):
+    """Caches of several processes on one path make one call between them, and take over after a failure"""
+    calls = []
+
+    async def fetch():
+        calls.append("fetch")
+        await asyncio.sleep(0.05)
+        return {"agent": "a"}
+
+    async def failing():
+        calls.append("failing")
+        await asyncio.sleep(0.05)
+        raise ConnectionError("down")
+
+    async def run():
+        # separate instances hold separate lock files, like separate job processes
+        caches = [SharedFileCache(str(tmp_path), ttl=60, poll_interval=0.01) for _ in range(3)]
+        values = await asyncio.gather(*(cache.do("agent-a", fetch) for cache in caches))
+        assert values == [{"agent": "a"}] * 3
+        assert calls == ["fetch"]
+        assert SharedFileCache(str(tmp_path), ttl=60).get("agent-a") == {"agent": "a"}
+        assert SharedFileCache(str(tmp_path), ttl=0).get("agent-a") is None
+
+        calls.clear()
+
+        async def later():
+            # the failing call holds the lock by then
+            await asyncio.sleep(0.02)
+            return await caches[1].do("agent-b", fetch)
+
+        results = await asyncio.gather(caches[0].do("agent-b", failing), later(), return_exceptions=True)
+        assert isinstance(results[0], ConnectionError) and results[1] == {"agent": "a"}
+        assert calls == ["failing", "fetch"]
+
+    asyncio.run(run())
+
+
+def test_semantic_cache_paraphrase_hit():
+    """A query close enough to a cached one is served from the cache"""
+    cache = SemanticCache(threshold=0.95, ttl=60, maxsize=4, name="test_semantic")
+    key = ("kb", "company")
+    cache.store(key, [1.0, 0.0, 0.0], "pricing results")
+
+    assert cache.lookup(key, [0.99, 0.05, 0.0]) == "pricing results"
+    assert cache.lookup(key, [0.0, 1.0, 0.0]) is None
+    assert cache.lookup(("kb", "other"), [1.0, 0.0, 0.0]) is None
+    assert cache.hits == 1 and cache.misses == 2
+
+    # exported per cache name
+    def exported(event):
+        return REGISTRY.get_sample_value("breezeflow_cache_events_total", {"cache": "test_semantic", "event": event})
+
+    assert exported("hit") == 1 and exported("miss") == 2
+
+
+def test_semantic_cache_eviction_and_version():
+    """Expired entries miss, full buckets evict the oldest and re-indexing clears the bucket"""
+    cache = SemanticCache(threshold=0.9, ttl=60, maxsize=2)
+    key = ("kb", "company")
+    vectors = np.eye(3, dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        cache.store(key, vector, i, version="v1")
+        time.sleep(0.001)
+
+    assert cache.lookup(key, vectors[0], version="v1") is None
+    assert cache.lookup(key, vectors[2], version="v1") == 2
+    assert cache.lookup(key, vectors[2], version="v2") is None
+    assert cache.lookup(key, vectors[2], version="v1") is None
+
+    expiring = SemanticCache(threshold=0.9, ttl=0.01, maxsize=2)
+    expiring.store(key, vectors[0], "stale")
+    time.sleep(0.02)
+    assert expiring.lookup(key, vectors[0]) is None
+
+
+if __name__ == "__main__":
+    test_ttl_cache_expiry()
+    test_ttl_cache_lru_eviction()
+    test_single_flight_coalesces()
+    test_single_flight_cancelled_waiter()
+    test_single_flight_abandoned_call_cancelled()
+    test_single_flight_per_event_loop()
+    test_semantic_cache_paraphrase_hit()
+    test_semantic_cache_eviction_and_version()
+
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as path:
+        test_shared_file_cache_one_call_per_host(path)
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+
+import pytest
+
+from clients import ClientRegistry
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def test_released_registry_refuses_new_clients():
+    """Clients are closed with the last session and not recreated by late calls on that loop"""
+    registry = ClientRegistry()
+
+    async def session():
+        registry.acquire()
+        return registry.http
+
+    async def run():
+        first, second = await asyncio.gather(session(), session())
+        assert first is second
+
+        await registry.release()
+        assert not first.closed
+        await registry.release()
+        assert first.closed
+
+        with pytest.raises(RuntimeError):
+            registry.http
+        with pytest.raises(RuntimeError):
+            registry.acquire()
+
+    asyncio.run(run())
+
+    async def next_job():
+        # a new job loop starts over
+        registry.acquire()
+        assert not registry.http.closed
+        await registry.release()
+
+    asyncio.run(next_job())
+
+
+if __name__ == "__main__":
+    test_released_registry_refuses_new_clients()
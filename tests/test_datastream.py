@@ -0,0 +1,64 @@
+import json
+import logging
+
+from datastream import DataStreamParser
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+STREAM = (
+    'f:{"messageId":"msg-1"}\n'
+    '0:"Hello, "\n'
+    '0:"caf\u00e9 \u2615 \\"quoted\\"\\n"\n'
+    '9:{"toolCallId":"call-1","toolName":"lookup","args":{"query":"pricing"}}\n'
+    'not a part\n'
+    '0:"broken\n'
+    'e:{"finishReason":"stop","usage":{"promptTokens":12,"completionTokens":5},"isContinued":false}\n'
+    'd:{"finishReason":"stop","usage":{"promptTokens":12,"completionTokens":5}}\n'
+).encode("utf-8")
+
+
+def parse(chunk_size: int):
+    parser = DataStreamParser()
+    parts = []
+    for i in range(0, len(STREAM), chunk_size):
+        parts.extend(parser.feed(STREAM[i:i + chunk_size]))
+    parts.extend(parser.flush())
+    return parts
+
+
+def test_parts_split_across_chunks():
+    """Parts and multi-byte characters split across network chunks are reassembled"""
+    expected = parse(len(STREAM))
+    for chunk_size in (1, 2, 3, 7, 64):
+        assert parse(chunk_size) == expected
+
+    assert [part.type for part in expected] == [
+        "start_step", "text", "text", "tool_call", "finish_step", "finish_message",
+    ]
+    assert expected[1].value + expected[2].value == 'Hello, caf\u00e9 \u2615 "quoted"\n'
+    assert expected[3].value["args"] == {"query": "pricing"}
+    assert expected[5].value["usage"]["completionTokens"] == 5
+
+
+def test_unterminated_final_part():
+    """A final part without a trailing newline is emitted on flush"""
+    parser = DataStreamParser()
+    assert parser.feed(b'0:"partial') == []
+    assert parser.feed(b'"') == []
+    parts = parser.flush()
+    assert len(parts) == 1 and parts[0].value == "partial"
+
+
+def test_error_part():
+    """Error parts are surfaced with their message"""
+    parser = DataStreamParser()
+    parts = parser.feed(b'3:' + json.dumps("rate limited").encode() + b'\n')
+    assert parts[0].type == "error" and parts[0].value == "rate limited"
+
+
+if __name__ == "__main__":
+    test_parts_split_across_chunks()
+    test_unterminated_final_part()
+    test_error_part()
@@ -0,0 +1,192 @@
+import os
+import asyncio
+import logging
+import tempfile
+import threading
+
+import numpy as np
+from prometheus_client import REGISTRY
+
+from embeddings import EmbeddingBatcher, EmbeddingCache, normalizeText
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def test_normalize_text():
+    """Case, whitespace and trailing punctuation do not change the cache key"""
+    assert normalizeText("  What is   Breezeflow? ") == "what is breezeflow"
+    assert EmbeddingCache.key("Pricing?") == EmbeddingCache.key("pricing")
+
+
+def test_embedding_cache_survives_restart():
+    """Embeddings written to disk are served by a fresh cache instance"""
+    with tempfile.TemporaryDirectory() as path:
+        vector = np.random.default_rng(0).random(16, dtype=np.float32)
+
+        cache = EmbeddingCache(maxsize=4, path=path)
+        assert cache.get("book a demo") is None
+        cache.put("book a demo", vector.tolist())
+        assert np.allclose(cache.get("Book a demo!"), vector)
+
+        restarted = EmbeddingCache(maxsize=4, path=path)
+        assert np.allclose(restarted.get("book a demo"), vector)
+        stats = restarted.stats()
+        assert stats["hits"] == 1 and stats["disk_hits"] == 1 and stats["misses"] == 0
+
+
+def test_embedding_cache_lru_eviction():
+    """Evicted entries fall back to the disk store"""
+    with tempfile.TemporaryDirectory() as path:
+        cache = EmbeddingCache(maxsize=1, path=path)
+        cache.put("pricing", [1.0, 0.0])
+        cache.put("what is x", [0.0, 1.0])
+
+        assert np.allclose(cache.get("pricing"), [1.0, 0.0])
+        assert cache.stats()["disk_hits"] == 1
+
+
+def test_embedding_cache_async_disk_access():
+    """On the event loop, disk appends and reads run in worker threads and still reach the store"""
+    with tempfile.TemporaryDirectory() as path:
+        vector = np.random.default_rng(1).random(16, dtype=np.float32)
+
+        async def run():
+            cache = EmbeddingCache(maxsize=4, path=path)
+            assert await cache.aget("book a demo") is None
+            write = cache.put_nowait("book a demo", vector.tolist())
+            # served from memory before the append has finished
+            assert np.allclose(await cache.aget("Book a demo!"), vector)
+            await write
+
+            restarted = EmbeddingCache(maxsize=4, path=path)
+            assert np.allclose(await restarted.aget("book a demo"), vector)
+            assert restarted.stats()["disk_hits"] == 1
+
+        asyncio.run(run())
+
+
+def test_embedding_cache_rotates_full_disk_store():
+    """A full disk store starts a new generation seeded with recent entries, and other instances follow it"""
+    with tempfile.TemporaryDirectory() as path:
+        cache = EmbeddingCache(maxsize=2, path=path, max_disk_entries=3, name="test_embedding")
+        other = EmbeddingCache(maxsize=2, path=path, max_disk_entries=3)
+        for i, text in enumerate(["a", "b", "c"]):
+            cache.put(text, [float(i + 1), 1.0])
+        assert np.allclose(other.get("a"), [1.0, 1.0])
+
+        # full: the fourth entry starts generation 1, seeded with the other remembered entry ("c")
+        cache.put("d", [4.0, 1.0])
+        assert cache.stats()["disk_generation"] == 1 and cache.stats()["disk_entries"] == 2
+        assert np.allclose(EmbeddingCache(maxsize=2, path=path).get("c"), [3.0, 1.0])
+
+        for _ in range(5):
+            cache.put(f"e{_}", [5.0, 1.0])
+        assert cache.stats()["rotations"] == 3
+        assert sorted(os.listdir(path)) == ["2", "3", "lock", "meta.json"]
+
+        fresh = EmbeddingCache(maxsize=2, path=path)
+        assert fresh.get("a") is None
+        assert np.allclose(fresh.get("e4"), [5.0, 1.0])
+        # an instance that was on an old generation follows the rotation
+        assert np.allclose(other.get("e4"), [5.0, 1.0])
+
+        exported = REGISTRY.get_sample_value("breezeflow_cache_events_total", {"cache": "test_embedding", "event": "rotated"})
+        assert exported == 3
+
+
+def test_batcher_coalesces_concurrent_requests():
+    """Concurrent requests share one call and each caller gets its own vector"""
+    calls = []
+
+    async def embed(texts):
+        calls.append(texts)
+        await asyncio.sleep(0.01)
+        return [[float(len(text))] for text in texts]
+
+    async def run():
+        batcher = EmbeddingBatcher(embed, max_batch=3, max_wait=0.01)
+        vectors = await asyncio.gather(*(batcher.embed(text) for text in ["a", "bb", "a", "ccc", "dddd"]))
+        return batcher, vectors
+
+    batcher, vectors = asyncio.run(run())
+    assert vectors == [[1.0], [2.0], [1.0], [3.0], [4.0]]
+    # duplicates are sent once, and batches are bounded by max_batch
+    assert calls == [["a", "bb"], ["ccc", "dddd"]]
+    assert batcher.stats()["batches"] == 2
+
+
+def test_batcher_sends_without_waiting_by_default():
+    """A lone request is sent at once, and the texts of one embed_many call share a call"""
+    calls = []
+
+    async def embed(texts):
+        calls.append(texts)
+        return [[float(len(text))] for text in texts]
+
+    async def run():
+        batcher = EmbeddingBatcher(embed)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        assert await batcher.embed("a") == [1.0]
+        assert loop.time() - start < 0.005
+        assert await batcher.embed_many(["bb", "ccc", "bb"]) == [[2.0], [3.0], [2.0]]
+
+    asyncio.run(run())
+    assert calls == [["a"], ["bb", "ccc"]]
+
+
+def test_batcher_failure_reaches_every_caller():
+    """A failed batch call raises in every caller of that batch"""
+    async def embed(texts):
+        raise TimeoutError("embeddings timed out")
+
+    async def run():
+        batcher = EmbeddingBatcher(embed, max_wait=0.001)
+        return await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, TimeoutError) for result in results)
+
+
+def test_batcher_keeps_each_event_loop_waiting():
+    """Requests from job loops in different threads are batched per loop and all answered"""
+    async def embed(texts):
+        await asyncio.sleep(0.01)
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingBatcher(embed, max_wait=0.05)
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def job(name, texts):
+        async def run():
+            await asyncio.to_thread(barrier.wait)
+            return await asyncio.wait_for(batcher.embed_many(texts), timeout=1)
+
+        results[name] = asyncio.run(run())
+
+    threads = [
+        threading.Thread(target=job, args=("a", ["a", "bb"])),
+        threading.Thread(target=job, args=("b", ["ccc"])),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": [[1.0], [2.0]], "b": [[3.0]]}
+    assert batcher.stats()["batches"] == 2
+
+
+if __name__ == "__main__":
+    test_normalize_text()
+    test_embedding_cache_survives_restart()
+    test_embedding_cache_lru_eviction()
+    test_embedding_cache_async_disk_access()
+    test_embedding_cache_rotates_full_disk_store()
+    test_batcher_coalesces_concurrent_requests()
+    test_batcher_sends_without_waiting_by_default()
+    test_batcher_failure_reaches_every_caller()
+    test_batcher_keeps_each_event_loop_waiting()
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import threading
+
+import numpy as np
+from qdrant_client import models
+
+import clients
+import localindex
+from clients import registry
+from localindex import LocalIndex
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+COLLECTION = "kb"
+DIM = 16
+
+
+def point(i: int, company: str, content: str) -> models.PointStruct:
+    vector = np.random.default_rng(i).standard_normal(DIM).tolist()
+    return models.PointStruct(id=i, vector=vector, payload={"companyId": company, "content": content})
+
+
+def test_sync_search_and_incremental_refresh(monkeypatch, tmp_path):
+    """The local index matches Qdrant's results and picks up changed points on a new version"""
+    monkeypatch.setattr(clients, "QDRANT_URL", ":memory:")
+    index = LocalIndex(str(tmp_path))
+
+    async def run():
+        client = registry.qdrant
+        await client.create_collection(COLLECTION, vectors_config=models.VectorParams(size=DIM, distance=models.Distance.COSINE))
+        await client.upsert(COLLECTION, points=[point(i, "acme" if i < 40 else "other", f"doc {i}") for i in range(60)])
+
+        assert index.get(COLLECTION, "acme", "v1") is None
+        await asyncio.sleep(0.2)
+        local = index.get(COLLECTION, "acme", "v1")
+        assert local is not None and len(local) == 40
+
+        query = np.random.default_rng(1000).standard_normal(DIM).tolist()
+        company_filter = models.Filter(must=[models.FieldCondition(key="companyId", match=models.MatchValue(value="acme"))])
+        remote = await client.query_points(COLLECTION, query=query, limit=3, with_payload=True, query_filter=company_filter)
+        result = local.search(query, limit=3)
+        assert [p.id for p in result.points] == [p.id for p in remote.points]
+        assert np.allclose([p.score for p in result.points], [p.score for p in remote.points], atol=1e-5)
+
+        # larger indexes are searched off the event loop
+        monkeypatch.setattr(localindex, "_INLINE_SEARCH_ROWS", 10)
+        threads = []
+        search = local.search
+
+        def recording_search(*args):
+            threads.append(threading.current_thread())
+            return search(*args)
+
+        monkeypatch.setattr(local, "search", recording_search)
+        assert (await local.asearch(query, limit=3)).points == result.points
+        assert threads and threads[0] is not threading.main_thread()
+
+        # one point changes, one is added; the old version is no longer served
+        await client.upsert(COLLECTION, points=[
+            models.PointStruct(id=5, vector=query, payload={"companyId": "acme", "content": "doc 5 updated"}),
+            point(70, "acme", "doc 70"),
+        ])
+        assert index.get(COLLECTION, "acme", "v2") is None
+        await asyncio.sleep(0.2)
+        local = index.get(COLLECTION, "acme", "v2")
+        assert len(local) == 41
+        top = local.search(query, limit=1).points[0]
+        assert top.id == 5 and top.payload["content"] == "doc 5 updated"
+
+        # a re-embedded point with an unchanged payload is picked up by its point version
+        # (local mode always reports version 0, so the bump a server makes is simulated)
+        await client.upsert(COLLECTION, points=[
+            models.PointStruct(id=6, vector=query, payload={"companyId": "acme", "content": "doc 6"}),
+        ])
+        list_points = client.query_points
+
+        async def versioned_query_points(*args, **kwargs):
+            response = await list_points(*args, **kwargs)
+            for p in response.points:
+                if p.id == 6:
+                    p.version = 1
+            return response
+
+        monkeypatch.setattr(client, "query_points", versioned_query_points)
+        assert index.get(COLLECTION, "acme", "v3") is None
+        await asyncio.sleep(0.2)
+        local = index.get(COLLECTION, "acme", "v3")
+        assert {p.id for p in local.search(query, limit=2).points} == {5, 6}
+
+        await registry.aclose()
+
+    asyncio.run(run())
+
+    async def reload():
+        # a new process reuses the synced index from disk, loaded by the background sync
+        reloaded = LocalIndex(str(tmp_path))
+        assert reloaded.get(COLLECTION, "acme", "v3") is None
+        await asyncio.sleep(0.1)
+        local = reloaded.get(COLLECTION, "acme", "v3")
+        assert local is not None and len(local) == 41
+        await registry.aclose()
+
+    asyncio.run(reload())
+
+
+def test_failed_sync_backs_off(monkeypatch, tmp_path):
+    """A failed sync is not retried on every lookup"""
+    monkeypatch.setattr(clients, "QDRANT_URL", ":memory:")
+    index = LocalIndex(str(tmp_path))
+    syncs = 0
+    sync = index._sync
+
+    async def counting_sync(key, version):
+        nonlocal syncs
+        syncs += 1
+        return await sync(key, version)
+
+    monkeypatch.setattr(index, "_sync", counting_sync)
+
+    async def run():
+        # the collection does not exist
+        for _ in range(5):
+            assert index.get(COLLECTION, "acme", "v1") is None
+            await asyncio.sleep(0.01)
+        await registry.aclose()
+
+    asyncio.run(run())
+    assert syncs == 1
+
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
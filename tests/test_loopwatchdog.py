@@ -0,0 +1,67 @@
+import time
+import asyncio
+import logging
+
+from loopwatchdog import LoopWatchdog
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def blocking_lookup():
+    time.sleep(0.3)
+
+
+def test_blocking_call_reported_with_stack():
+    """A blocking call on the loop is reported once, with the offending function in the stack"""
+    watchdog = LoopWatchdog(interval=0.02, threshold=0.05)
+
+    async def run():
+        watchdog.start()
+        await asyncio.sleep(0.1)
+        blocking_lookup()
+        await asyncio.sleep(0.1)
+        watchdog.stop()
+
+    asyncio.run(run())
+    assert watchdog.stalls == 1
+    assert "blocking_lookup" in watchdog.last_stack
+
+
+def test_stall_logged_once(caplog):
+    """The heartbeat's lag for a stall the thread already reported is not logged as a warning again"""
+    watchdog = LoopWatchdog(interval=0.02, threshold=0.05)
+
+    async def run():
+        watchdog.start()
+        await asyncio.sleep(0.1)
+        blocking_lookup()
+        await asyncio.sleep(0.1)
+        watchdog.stop()
+
+    with caplog.at_level(logging.DEBUG, logger="loopwatchdog"):
+        asyncio.run(run())
+    warnings = [r.getMessage() for r in caplog.records if r.name == "loopwatchdog" and r.levelno == logging.WARNING]
+    assert len(warnings) == 1 and "loop thread stack" in warnings[0]
+    assert any("lagged" in r.getMessage() for r in caplog.records if r.levelno == logging.DEBUG)
+
+
+def test_idle_loop_has_no_stalls():
+    """A loop that only awaits records lag but no stalls"""
+    watchdog = LoopWatchdog(interval=0.01, threshold=0.1)
+
+    async def run():
+        watchdog.start()
+        watchdog.start()
+        await asyncio.sleep(0.2)
+        watchdog.stop()
+
+    asyncio.run(run())
+    assert watchdog.stalls == 0
+    assert watchdog.lag < 0.1
+
+
+if __name__ == "__main__":
+    test_blocking_call_reported_with_stack()
+    test_idle_loop_has_no_stalls()
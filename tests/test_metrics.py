@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from metrics import SessionTracer, span, stage_latency
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def sample_count(stage: str) -> float:
+    for metric in stage_latency.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count") and sample.labels.get("stage") == stage:
+                return sample.value
+    return 0.0
+
+
+def test_span_records_histogram_and_session_turn():
+    """Spans are observed in the histogram and in the tracer of the task's context"""
+    tracer = SessionTracer("room-1")
+    before = sample_count("qdrant_query")
+
+    async def run():
+        tracer.activate()
+
+        async def tool():
+            with span("qdrant_query"):
+                await asyncio.sleep(0.01)
+
+        await asyncio.create_task(tool())
+
+    asyncio.run(run())
+    assert sample_count("qdrant_query") == before + 1
+    assert tracer._timings["qdrant_query"] >= 0.01
+
+
+def test_end_of_turn_to_first_audio():
+    """The gap between the user stopping and the agent speaking closes the turn"""
+    tracer = SessionTracer("room-2")
+    before = sample_count("end_of_turn_to_first_audio")
+
+    tracer._on_user_state_changed(SimpleNamespace(old_state="listening", new_state="speaking"))
+    tracer._on_user_state_changed(SimpleNamespace(old_state="speaking", new_state="listening"))
+    tracer._on_agent_state_changed(SimpleNamespace(old_state="thinking", new_state="speaking"))
+
+    assert sample_count("end_of_turn_to_first_audio") == before + 1
+    assert tracer.turns == 1 and tracer._timings == {}
+
+
+if __name__ == "__main__":
+    test_span_records_histogram_and_session_turn()
+    test_end_of_turn_to_first_audio()
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+
+import prefetch
+from embeddings import normalizeText
+from prompt import AgentConfig
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+AGENT_CONFIG = AgentConfig(
+    agent_id="agent",
+    system_prompt="",
+    collection_name="kb",
+    company_id="company",
+)
+
+# one dimension per topic, so paraphrases of a question embed close together
+TOPICS = [("cost", "price", "pricing"), ("pro", "plan"), ("trial",), ("shopify", "integrate")]
+
+
+async def fake_embedding(text):
+    words = normalizeText(text).split()
+    return [float(sum(word.startswith(topic) for word in words for topic in synonyms)) for synonyms in TOPICS]
+
+
+def test_prefetch_cancels_stale_transcripts(monkeypatch):
+    """Only the latest transcript is retrieved and the tool query is served from it"""
+    queries = []
+
+    async def fake_query(query, collection_name, companyId, kb_version=None):
+        queries.append(query)
+        return f"results for {query}"
+
+    monkeypatch.setattr(prefetch, "queryQdrant", fake_query)
+    monkeypatch.setattr(prefetch, "getEmbedding", fake_embedding)
+
+    async def run():
+        prefetcher = prefetch.SpeculativePrefetcher(AGENT_CONFIG, debounce=0.01)
+        prefetcher.on_transcript("how much does")
+        prefetcher.on_transcript("how much does it cost")
+        await asyncio.sleep(0.05)
+
+        hit = await prefetcher.lookup("How much does it cost?")
+        miss = await prefetcher.lookup("do you integrate with shopify")
+        await prefetcher.aclose()
+        return prefetcher, hit, miss
+
+    prefetcher, hit, miss = asyncio.run(run())
+    assert queries == ["how much does it cost"]
+    assert hit == "results for how much does it cost"
+    assert miss is None
+    assert prefetcher.stats()["cancelled"] == 1
+    assert prefetcher.stats()["hit_rate"] == 0.5
+
+
+def test_prefetch_cancels_superseded_interim_query(monkeypatch):
+    """A running query for an interim transcript stops when a newer transcript arrives; final ones are kept"""
+    started = []
+    cancelled = []
+
+    async def fake_query(query, collection_name, companyId, kb_version=None):
+        started.append(query)
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+        return f"results for {query}"
+
+    monkeypatch.setattr(prefetch, "queryQdrant", fake_query)
+    monkeypatch.setattr(prefetch, "getEmbedding", fake_embedding)
+
+    async def run():
+        prefetcher = prefetch.SpeculativePrefetcher(AGENT_CONFIG, debounce=0.01)
+        # interim transcripts slower than the debounce, as from a realtime STT
+        prefetcher.on_transcript("how much does")
+        await asyncio.sleep(0.03)
+        prefetcher.on_transcript("how much does it")
+        await asyncio.sleep(0.03)
+        prefetcher.on_transcript("how much does it cost", is_final=True)
+        await asyncio.sleep(0.03)
+        prefetcher.on_transcript("and is there a trial")
+
+        hit = await prefetcher.lookup("how much does it cost")
+        stale = await prefetcher.lookup("how much does it")
+        superseded = list(cancelled)
+        stats = prefetcher.stats()
+        await prefetcher.aclose()
+        return superseded, stats, hit, stale
+
+    superseded, stats, hit, stale = asyncio.run(run())
+    assert started[:3] == ["how much does", "how much does it", "how much does it cost"]
+    assert superseded == ["how much does", "how much does it"]
+    assert hit == "results for how much does it cost"
+    assert stale is None
+    assert stats["cancelled"] == 2
+
+
+def test_prefetch_matches_paraphrased_tool_query(monkeypatch):
+    """The model's wording of the tool query is matched to the transcript by embedding similarity"""
+    async def fake_query(query, collection_name, companyId, kb_version=None):
+        await asyncio.sleep(0.05)
+        return f"results for {query}"
+
+    monkeypatch.setattr(prefetch, "queryQdrant", fake_query)
+    monkeypatch.setattr(prefetch, "getEmbedding", fake_embedding)
+
+    async def run():
+        prefetcher = prefetch.SpeculativePrefetcher(AGENT_CONFIG, debounce=0.01)
+        prefetcher.on_transcript("um so what does the pro plan cost", is_final=True)
+        await asyncio.sleep(0.02)
+
+        # still running: the lookup waits for it
+        hit = await prefetcher.lookup("Pro plan pricing")
+        miss = await prefetcher.lookup("Shopify integration")
+        stats = prefetcher.stats()
+        await prefetcher.aclose()
+        return hit, miss, stats
+
+    hit, miss, stats = asyncio.run(run())
+    assert hit == "results for um so what does the pro plan cost"
+    assert miss is None
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_prefetch_lookup_of_cancelled_query_is_a_miss(monkeypatch):
+    """A tool waiting on a query that a newer transcript cancels falls back instead of being cancelled"""
+    async def fake_query(query, collection_name, companyId, kb_version=None):
+        await asyncio.sleep(0.2)
+        return f"results for {query}"
+
+    monkeypatch.setattr(prefetch, "queryQdrant", fake_query)
+    monkeypatch.setattr(prefetch, "getEmbedding", fake_embedding)
+
+    async def run():
+        prefetcher = prefetch.SpeculativePrefetcher(AGENT_CONFIG, debounce=0.01)
+        prefetcher.on_transcript("is there a free trial")
+        await asyncio.sleep(0.03)
+
+        lookup = asyncio.ensure_future(prefetcher.lookup("is there a free trial"))
+        await asyncio.sleep(0.01)
+        prefetcher.on_transcript("what does shopify integration cost")
+        result = await lookup
+        await prefetcher.aclose()
+        return result, prefetcher.stats()
+
+    result, stats = asyncio.run(run())
+    assert result is None
+    assert stats["misses"] == 1
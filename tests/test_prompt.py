@@ -0,0 +1,120 @@
+import asyncio
+import logging
+
+import numpy as np
+from qdrant_client import models
+
+import clients
+import prompt
+from clients import registry
+from embeddings import EmbeddingBatcher, EmbeddingCache
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+COLLECTION = "kb"
+DIM = 16
+
+
+def embed(text):
+    # the same vector for every spelling of a text, as the embedding cache assumes
+    seed = int.from_bytes(EmbeddingCache.key(text).encode()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(DIM).tolist()
+
+
+def use_fake_embeddings(monkeypatch):
+    batches = []
+
+    async def embed_batch(texts):
+        batches.append(list(texts))
+        await asyncio.sleep(0.01)
+        return [embed(text) for text in texts]
+
+    monkeypatch.setattr(prompt, "embedding_cache", EmbeddingCache(maxsize=64))
+    monkeypatch.setattr(prompt, "embedding_batcher", EmbeddingBatcher(embed_batch, max_wait=0.001))
+    return batches
+
+
+def test_get_embeddings_shared_by_differently_written_texts(monkeypatch):
+    """Concurrent callers whose texts normalize the same share one request and each get their vectors"""
+    batches = use_fake_embeddings(monkeypatch)
+
+    async def run():
+        return await asyncio.gather(
+            prompt.getEmbeddings(["pricing", "cost"]),
+            prompt.getEmbeddings(["Pricing?", "cost"]),
+        )
+
+    first, second = asyncio.run(run())
+    assert len(batches) == 1
+    assert first == second == [embed("pricing"), embed("cost")]
+
+
+def test_query_qdrant_expanded(monkeypatch):
+    """Expanded retrieval embeds every variant in one request and fuses their rankings"""
+    monkeypatch.setattr(clients, "QDRANT_URL", ":memory:")
+    monkeypatch.setattr(prompt, "RETRIEVAL_MODE", "expanded")
+    monkeypatch.setattr(prompt, "local_index", None)
+    monkeypatch.setattr(prompt, "semantic_cache", prompt.SemanticCache(threshold=0.99, ttl=60, maxsize=16))
+    batches = use_fake_embeddings(monkeypatch)
+
+    query = "How much does it cost?"
+    last_turn = "Tell me about the Pro plan"
+    variants = [query, "much cost", f"{last_turn} {query}"]
+
+    async def run():
+        client = registry.qdrant
+        await client.create_collection(COLLECTION, vectors_config=models.VectorParams(size=DIM, distance=models.Distance.COSINE))
+        # each variant's nearest point, plus another company's copy of the first one
+        await client.upsert(COLLECTION, points=[
+            models.PointStruct(id=i, vector=embed(variant), payload={"companyId": "acme", "content": f"answer {i}"})
+            for i, variant in enumerate(variants)
+        ] + [
+            models.PointStruct(id=10, vector=embed(query), payload={"companyId": "other", "content": "answer 0"}),
+        ])
+
+        response = await prompt.queryQdrant(query, COLLECTION, "acme", last_turn=last_turn)
+        await registry.aclose()
+        return response
+
+    response = asyncio.run(run())
+    assert batches == [variants]
+    assert len(response.points) == prompt.RETRIEVAL_LIMIT
+    assert {point.id for point in response.points} == {0, 1, 2}
+
+
+def test_reindexed_knowledge_base_drops_cached_results(monkeypatch):
+    """A new knowledge-base version in the agent document invalidates the company's cached results"""
+    versions = iter(["v1", "v2"])
+
+    class FakeUpstream:
+        async def call(self, fnc):
+            return {"data": {
+                "company": {"_id": "acme"},
+                "KnowledgeBase": [{"collectionName": COLLECTION, "updatedAt": next(versions)}],
+            }}
+
+    monkeypatch.setattr(prompt, "agent_config_upstream", FakeUpstream())
+    monkeypatch.setattr(prompt, "_agent_documents", None)
+    # every call goes to the agent API
+    monkeypatch.setattr(prompt, "_agent_configs", prompt.TTLCache(maxsize=4, ttl=0))
+    monkeypatch.setattr(prompt, "_stale_agent_configs", prompt.TTLCache(maxsize=4, ttl=60))
+    semantic_cache = prompt.SemanticCache(threshold=0.9, ttl=60, maxsize=4, name="semantic")
+    monkeypatch.setattr(prompt, "semantic_cache", semantic_cache)
+
+    async def run():
+        config = await prompt.getAgentConfig("agent")
+        semantic_cache.store((COLLECTION, "acme"), embed("pricing"), "results", version=None)
+        assert semantic_cache.lookup((COLLECTION, "acme"), embed("pricing")) == "results"
+
+        config = await prompt.getAgentConfig("agent")
+        assert config.kb_version == "v2"
+        assert semantic_cache.lookup((COLLECTION, "acme"), embed("pricing")) is None
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+
+import aiohttp
+import pytest
+
+from resilience import CircuitOpenError, Upstream
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def test_circuit_opens_and_recovers():
+    """Consecutive failures open the circuit; a probe after the reset timeout closes it again"""
+    upstream = Upstream("test", deadline=1.0, hedge=False, failure_threshold=2, reset_timeout=0.1)
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        raise ConnectionError("down")
+
+    async def working():
+        return "ok"
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await upstream.call(failing)
+        with pytest.raises(CircuitOpenError):
+            await upstream.call(failing)
+        assert calls == 2
+
+        await asyncio.sleep(0.15)
+        assert await upstream.call(working) == "ok"
+        assert upstream.breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_slow_request_is_hedged_and_bounded_by_deadline():
+    """A slow first attempt is raced by a hedge; a call that never answers misses the deadline"""
+    upstream = Upstream("test", deadline=0.5, hedge=True, hedge_min_delay=0.01)
+    attempts = 0
+
+    async def fast():
+        await asyncio.sleep(0.001)
+        return "fast"
+
+    async def slow_then_fast():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(10 if attempts == 1 else 0.001)
+        return attempts
+
+    async def hanging():
+        await asyncio.sleep(10)
+
+    async def run():
+        # enough samples for the p95-based hedge delay
+        for _ in range(20):
+            await upstream.call(fast)
+        assert upstream.hedge_delay() == pytest.approx(0.01, abs=0.01)
+
+        assert await asyncio.wait_for(upstream.call(slow_then_fast), timeout=0.2) == 2
+
+        with pytest.raises(asyncio.TimeoutError):
+            await upstream.call(hanging)
+
+    asyncio.run(run())
+
+
+def test_client_errors_do_not_open_circuit():
+    """Rejected requests (4xx) leave the circuit closed; 5xx answers open it"""
+    upstream = Upstream("test", deadline=1.0, hedge=False, failure_threshold=2, reset_timeout=10)
+
+    def responding(status):
+        async def call():
+            raise aiohttp.ClientResponseError(None, (), status=status)
+        return call
+
+    async def run():
+        for status in (400, 404, 404):
+            with pytest.raises(aiohttp.ClientResponseError):
+                await upstream.call(responding(status))
+        assert upstream.breaker.state == "closed"
+
+        for _ in range(2):
+            with pytest.raises(aiohttp.ClientResponseError):
+                await upstream.call(responding(503))
+        assert upstream.breaker.state == "open"
+
+    asyncio.run(run())
+
+    blocking = Upstream("test", deadline=1.0, failure_threshold=1)
+    with pytest.raises(ValueError):
+        blocking.call_sync(lambda: int("not a number"))
+    assert blocking.breaker.state == "closed"
+
+
+if __name__ == "__main__":
+    test_circuit_opens_and_recovers()
+    test_slow_request_is_hedged_and_bounded_by_deadline()
+    test_client_errors_do_not_open_circuit()
@@ -0,0 +1,46 @@
+import logging
+
+from qdrant_client.http.models import QueryResponse, ScoredPoint
+
+from retrieval import expandQuery, fuseResults, keywordQuery
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def response(*points):
+    return QueryResponse(points=[
+        ScoredPoint(id=point_id, version=0, score=score, payload={"content": content})
+        for point_id, score, content in points
+    ])
+
+
+def test_expand_query():
+    """A spoken query expands into original, keyword-only and contextualized variants"""
+    assert keywordQuery("Um, how much does the Pro plan cost?") == "much pro plan cost"
+    assert expandQuery("How much does it cost?", "Tell me about the Pro plan") == [
+        "How much does it cost?",
+        "much cost",
+        "Tell me about the Pro plan How much does it cost?",
+    ]
+    # duplicates and the current turn itself are not repeated
+    assert expandQuery("pricing", "Pricing?") == ["pricing"]
+
+
+def test_reciprocal_rank_fusion_dedups_chunks():
+    """Points ranked well by several variants win, and duplicated chunks are returned once"""
+    fused = fuseResults([
+        response((1, 0.9, "Plans start at $10"), (2, 0.8, "Refunds within 30 days")),
+        response((3, 0.85, "Pro costs $30"), (1, 0.7, "Plans start at $10")),
+        response((3, 0.6, "Pro costs $30"), (4, 0.5, "plans start at $10")),
+    ], limit=3)
+
+    assert [point.id for point in fused.points] == [3, 1, 2]
+    # the best similarity score of a point is kept
+    assert fused.points[1].score == 0.9
+
+
+if __name__ == "__main__":
+    test_expand_query()
+    test_reciprocal_rank_fusion_dedups_chunks()
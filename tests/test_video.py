@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+from livekit import rtc
+
+from video import VideoFramePipeline, thumbnail
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def make_frame(luma: np.ndarray) -> rtc.VideoFrame:
+    height, width = luma.shape
+    chroma = np.full((height // 2) * (width // 2) * 2, 128, dtype=np.uint8)
+    data = np.concatenate([luma.astype(np.uint8).ravel(), chroma]).tobytes()
+    return rtc.VideoFrame(width, height, rtc.VideoBufferType.I420, data)
+
+
+def test_thumbnail_averages_luma():
+    """The thumbnail is a size x size grid of mean luma values"""
+    luma = np.zeros((128, 128), dtype=np.uint8)
+    luma[:64] = 200
+    thumb = thumbnail(make_frame(luma))
+    assert thumb.shape == (32, 32)
+    assert np.allclose(thumb[:16], 200) and np.allclose(thumb[16:], 0)
+
+
+def test_unchanged_frames_are_not_resent():
+    """take_latest skips frames that did not change since the last image sent"""
+    pipeline = VideoFramePipeline(max_width=64, max_height=64, change_threshold=0.02)
+    luma = np.zeros((128, 128), dtype=np.uint8)
+
+    pipeline._latest = pipeline._encode(make_frame(luma))
+    assert pipeline.take_latest() is not None
+
+    noisy = luma + np.random.default_rng(0).integers(0, 4, luma.shape, dtype=np.uint8)
+    image, _ = pipeline._encode(make_frame(noisy))
+    assert image is None
+
+    pipeline._latest = ("stale", thumbnail(make_frame(noisy)))
+    assert pipeline.take_latest() is None
+
+    changed = luma.copy()
+    changed[:32, :32] = 255
+    pipeline._latest = pipeline._encode(make_frame(changed))
+    assert pipeline.take_latest() is not None
+    assert pipeline.sent == 2 and pipeline.skipped == 1
+
+
+class CameraStream:
+    """Always has a fresh frame ready, like a 30fps camera behind a capacity=1 ring queue."""
+
+    def __init__(self, frame: rtc.VideoFrame) -> None:
+        self.frame = frame
+        self.reads = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self.reads += 1
+        await asyncio.sleep(1 / 30)
+        return SimpleNamespace(frame=self.frame)
+
+
+def test_stream_read_once_per_sample():
+    """The reader wakes once per sample interval, not for every camera frame"""
+    pipeline = VideoFramePipeline(sample_fps=5, max_width=64, max_height=64)
+    stream = CameraStream(make_frame(np.zeros((128, 128), dtype=np.uint8)))
+
+    async def run():
+        task = asyncio.create_task(pipeline._read_stream(stream))
+        await asyncio.sleep(1.0)
+        task.cancel()
+
+    asyncio.run(run())
+    # 30 camera frames went by; at 5fps about 5 of them are read
+    assert 4 <= stream.reads <= 7
+    assert pipeline.take_latest() is not None
+
+
+if __name__ == "__main__":
+    test_thumbnail_averages_luma()
+    test_unchanged_frames_are_not_resent()
+    test_stream_read_once_per_sample()
@@ -0,0 +1,74 @@
+import os
+import sys
+import logging
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+from workerload import WorkerLoad
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+JOB_PROCESS = """
+import sys
+from metrics import loop_lag_current, pending_tool_calls
+loop_lag_current.set(float(sys.argv[1]))
+pending_tool_calls.inc(int(sys.argv[2]))
+print("ready", flush=True)
+sys.stdin.read()
+"""
+
+
+def test_score_is_most_saturated_signal():
+    """The load is the most saturated of CPU, sessions, loop lag and tool calls"""
+    load = WorkerLoad(max_sessions=10, max_loop_lag=0.1, max_pending_tools=20)
+    assert load.score(2) == 0.2
+
+    load.loop_lag = 0.05
+    assert load.score(2) == 0.5
+
+    load.pending_tools = 40
+    assert load.score(2) == 1.0
+
+
+def test_reads_live_job_process_gauges():
+    """Loop lag and pending tool calls are read back from the job processes' multiprocess files"""
+    with tempfile.TemporaryDirectory() as path:
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=path)
+        jobs = [
+            subprocess.Popen(
+                [sys.executable, "-c", JOB_PROCESS, lag, tools],
+                cwd=ROOT, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+            )
+            for lag, tools in (("0.02", "3"), ("0.08", "4"))
+        ]
+        # an exited job process leaves its files behind; they must not count
+        finished = subprocess.Popen(
+            [sys.executable, "-c", JOB_PROCESS, "0.5", "30"],
+            cwd=ROOT, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+        finished.communicate("")
+        assert os.path.exists(os.path.join(path, f"gauge_all_{finished.pid}.db"))
+        try:
+            for job in jobs:
+                assert job.stdout.readline().strip() == "ready"
+
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+            load = WorkerLoad(max_sessions=10, max_loop_lag=0.1, max_pending_tools=20)
+            load._read_job_metrics()
+            assert abs(load.loop_lag - 0.08) < 1e-9
+            assert load.pending_tools == 7
+            assert abs(load(SimpleNamespace(active_jobs=[])) - 0.8) < 1e-9
+        finally:
+            os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+            for job in jobs:
+                job.communicate("")
+
+
+if __name__ == "__main__":
+    test_score_is_most_saturated_signal()
+    test_reads_live_job_process_gauges()
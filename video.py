@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import base64
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from livekit import rtc
+from livekit.agents.utils import images
+
+logger = logging.getLogger(__name__)
+
+# Default values for environment variables
+VIDEO_SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", "1"))
+VIDEO_MAX_WIDTH = int(os.getenv("VIDEO_MAX_WIDTH", "1024"))
+VIDEO_MAX_HEIGHT = int(os.getenv("VIDEO_MAX_HEIGHT", "1024"))
+VIDEO_JPEG_QUALITY = int(os.getenv("VIDEO_JPEG_QUALITY", "75"))
+VIDEO_ENCODE_WORKERS = int(os.getenv("VIDEO_ENCODE_WORKERS", "2"))
+# Fraction of thumbnail cells that must change before a frame is sent to the model again
+VIDEO_CHANGE_THRESHOLD = float(os.getenv("VIDEO_CHANGE_THRESHOLD", "0.02"))
+
+_THUMBNAIL_SIZE = 32
+# Per-cell luma difference (0-255) that counts as a change rather than compression noise
+_CELL_DIFF = 16
+_LUMA_FIRST_TYPES = (rtc.VideoBufferType.I420, rtc.VideoBufferType.I420A, rtc.VideoBufferType.NV12)
+
+# Shared by every room in the process so encoding never runs on the event loop
+_encode_executor = ThreadPoolExecutor(max_workers=VIDEO_ENCODE_WORKERS, thread_name_prefix="video-encode")
+
+
+class VideoFramePipeline:
+    """Samples a video track at a low rate and keeps the latest frame as a bounded-size JPEG.
+
+    Frames are downscaled and encoded in a thread pool; only the most recent
+    encoded image is kept, ready to be attached to the next user turn. Alongside
+    the JPEG a 32x32 luma thumbnail is computed, and ``take_latest`` only hands
+    out an image when the scene changed meaningfully since the last image sent.
+    """
+
+    def __init__(
+        self,
+        *,
+        sample_fps: float = VIDEO_SAMPLE_FPS,
+        max_width: int = VIDEO_MAX_WIDTH,
+        max_height: int = VIDEO_MAX_HEIGHT,
+        quality: int = VIDEO_JPEG_QUALITY,
+        change_threshold: float = VIDEO_CHANGE_THRESHOLD,
+    ) -> None:
+        self._change_threshold = change_threshold
+        self._interval = 1.0 / sample_fps if sample_fps > 0 else 0.0
+        self._encode_options = images.EncodeOptions(
+            format="JPEG",
+            quality=quality,
+            resize_options=images.ResizeOptions(
+                width=max_width,
+                height=max_height,
+                strategy="scale_aspect_fit",
+            ),
+        )
+        self._stream: rtc.VideoStream | None = None
+        self._task: asyncio.Task | None = None
+        self._latest: tuple[str, np.ndarray] | None = None
+        self._sent_thumbnail: np.ndarray | None = None
+
+        self.sent = 0
+        self.skipped = 0
+
+    def start(self, track: rtc.Track) -> None:
+        # Close any existing stream (we only want one at a time)
+        if self._task is not None:
+            self._task.cancel()
+        if self._stream is not None:
+            asyncio.create_task(self._stream.aclose())
+
+        # capacity=1 lets the FFI drop frames we are too slow to read instead of queueing them
+        self._stream = rtc.VideoStream(track, capacity=1)
+        self._task = asyncio.create_task(self._read_stream(self._stream))
+
+    def take_latest(self) -> str | None:
+        """Return the latest encoded frame as a data URL, or None if nothing changed since the last one sent."""
+        latest, self._latest = self._latest, None
+        if latest is None:
+            return None
+
+        image, thumb = latest
+        if self._sent_thumbnail is not None and not self._changed(thumb, self._sent_thumbnail):
+            self.skipped += 1
+            return None
+
+        self._sent_thumbnail = thumb
+        self.sent += 1
+        return image
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self._stream is not None:
+            await self._stream.aclose()
+        self._task = self._stream = None
+        logger.info(f"Video frames sent: {self.sent}, skipped unchanged: {self.skipped}")
+
+    async def _read_stream(self, stream: rtc.VideoStream) -> None:
+        loop = asyncio.get_running_loop()
+
+        async for event in stream:
+            encoding = loop.run_in_executor(_encode_executor, self._encode, event.frame)
+            encoding.add_done_callback(self._on_encoded)
+            # sleep until the next sample instead of waking for every frame: the stream's
+            # capacity=1 ring queue keeps only the newest frame and drops the ones in between
+            await asyncio.sleep(self._interval)
+            await asyncio.wait([encoding])
+
+    def _encode(self, frame: rtc.VideoFrame) -> tuple[str | None, np.ndarray]:
+        thumb = thumbnail(frame)
+        # the model has already seen this scene, skip the JPEG encode entirely
+        sent = self._sent_thumbnail
+        if sent is not None and not self._changed(thumb, sent):
+            return None, thumb
+
+        data = images.encode(frame, self._encode_options)
+        image = "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+        return image, thumb
+
+    def _changed(self, thumb: np.ndarray, previous: np.ndarray) -> bool:
+        if thumb.shape != previous.shape:
+            return True
+        changed_cells = np.count_nonzero(np.abs(thumb - previous) > _CELL_DIFF)
+        return changed_cells / thumb.size > self._change_threshold
+
+    def _on_encoded(self, fut: asyncio.Future) -> None:
+        if fut.cancelled():
+            return
+        if fut.exception() is not None:
+            logger.warning(f"Failed to encode video frame: {fut.exception()}")
+            return
+        image, thumb = fut.result()
+        self._latest = (image, thumb) if image is not None else None
+
+
+def thumbnail(frame: rtc.VideoFrame, size: int = _THUMBNAIL_SIZE) -> np.ndarray:
+    """Average the frame's luma plane down to a ``size`` x ``size`` grid."""
+    if frame.type not in _LUMA_FIRST_TYPES:
+        frame = frame.convert(rtc.VideoBufferType.I420)
+
+    width, height = frame.width, frame.height
+    luma = np.frombuffer(frame.data, dtype=np.uint8, count=width * height).reshape(height, width)
+    if height < size or width < size:
+        return luma.astype(np.float32)
+
+    # crop to a multiple of the grid so every cell averages the same number of pixels
+    luma = luma[: height - height % size, : width - width % size]
+    cells = luma.reshape(size, luma.shape[0] // size, size, luma.shape[1] // size)
+    return cells.mean(axis=(1, 3), dtype=np.float32)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import os
+import logging
+import threading
+
+import psutil
+from livekit.agents import utils
+from livekit.agents.utils.hw import get_cpu_monitor
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Default values for environment variables
+# Worker load above which the dispatcher stops sending new rooms to this worker
+LOAD_THRESHOLD = float(os.getenv("LOAD_THRESHOLD", "0.7"))
+# Sessions one worker holds at full load (see benchmarks/loadgen.py for a measured figure)
+LOAD_MAX_SESSIONS = int(os.getenv("LOAD_MAX_SESSIONS", "25"))
+# Worst job-process loop lag, in seconds, that counts as full load
+LOAD_MAX_LOOP_LAG = float(os.getenv("LOAD_MAX_LOOP_LAG", "0.1"))
+# Tool calls in flight across job processes that count as full load
+LOAD_MAX_PENDING_TOOLS = int(os.getenv("LOAD_MAX_PENDING_TOOLS", "50"))
+
+_LOOP_LAG_METRIC = "breezeflow_event_loop_lag_current_seconds"
+_PENDING_TOOLS_METRIC = "breezeflow_pending_tool_calls"
+
+
+class WorkerLoad:
+    """Load function for ``WorkerOptions.load_fnc``, scoring the worker between 0 and 1.
+
+    The score is the most saturated of four signals, each relative to its
+    capacity: CPU (cgroup aware, averaged like livekit's default), active
+    sessions, the worst event-loop lag of the job processes, and the tool calls
+    in flight. Job processes publish lag and tool calls as multiprocess gauges;
+    a sampler thread in the worker process reads them back from
+    ``PROMETHEUS_MULTIPROC_DIR`` so the load function itself never blocks.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_sessions: int = LOAD_MAX_SESSIONS,
+        max_loop_lag: float = LOAD_MAX_LOOP_LAG,
+        max_pending_tools: int = LOAD_MAX_PENDING_TOOLS,
+    ) -> None:
+        self._max_sessions = max_sessions
+        self._max_loop_lag = max_loop_lag
+        self._max_pending_tools = max_pending_tools
+
+        self._cpu = utils.MovingAverage(5)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+        self.loop_lag = 0.0
+        self.pending_tools = 0
+
+    def __call__(self, worker) -> float:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._sample, name="worker-load-monitor", daemon=True)
+                    self._thread.start()
+        return self.score(len(worker.active_jobs))
+
+    def score(self, active_sessions: int) -> float:
+        with self._lock:
+            cpu = self._cpu.get_avg()
+        load = max(
+            cpu,
+            active_sessions / self._max_sessions if self._max_sessions else 0.0,
+            self.loop_lag / self._max_loop_lag if self._max_loop_lag else 0.0,
+            self.pending_tools / self._max_pending_tools if self._max_pending_tools else 0.0,
+        )
+        return min(load, 1.0)
+
+    def _sample(self) -> None:
+        cpu_monitor = get_cpu_monitor()
+        while True:
+            # blocks for the sampling interval
+            cpu = cpu_monitor.cpu_percent(interval=0.5)
+            with self._lock:
+                self._cpu.add_sample(cpu)
+            try:
+                self._read_job_metrics()
+            except Exception as e:
+                logger.debug(f"Failed to read job process metrics: {str(e)}")
+
+    def _read_job_metrics(self) -> None:
+        path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+        if not path or not os.path.isdir(path):
+            return
+
+        # every room is a new job process and livekit never removes the files of exited
+        # ones, so only the "all"-mode gauge files of live children are read, never the whole dir
+        files = []
+        for child in psutil.Process().children(recursive=True):
+            file = os.path.join(path, f"gauge_all_{child.pid}.db")
+            if os.path.exists(file):
+                files.append(file)
+
+        loop_lag = 0.0
+        pending_tools = 0
+        for metric in multiprocess.MultiProcessCollector.merge(files, accumulate=False):
+            if metric.name not in (_LOOP_LAG_METRIC, _PENDING_TOOLS_METRIC):
+                continue
+            for sample in metric.samples:
+                if metric.name == _LOOP_LAG_METRIC:
+                    loop_lag = max(loop_lag, sample.value)
+                else:
+                    pending_tools += int(sample.value)
+
+        self.loop_lag = loop_lag
+        self.pending_tools = pending_tools
+
+
+worker_load = WorkerLoad()